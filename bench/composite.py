@@ -0,0 +1,136 @@
+# ==========================================
+# bench/composite.py – 混合内核精度校验 + 微基准
+# 用法（项目根目录）：python -m bench.composite [--repeat 20]
+# 1. 精度：逐层与旧版 float64 逐通道混合比对（颜色误差 ≤ 1，透明度按 over 公式比对）
+# 2. 速度：在 3600x5100 的 PSD 原始画布上叠加真实图层，比较两种实现
+# ==========================================
+
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(os.path.join(ROOT, "src"))     # 资源路径均相对 src/
+
+import numpy as np
+from src.composite import blend_over
+from src.generate import layer_cache
+from src.manifest import get_manifest
+
+PSD_SIZE = (3600, 5100)     # 宽, 高
+
+def blend_over_float(dst, src):
+    """
+    旧版 generate_fgimage 的混合循环（float64 逐通道 + alpha 取最大值）
+    """
+    alpha_img = src[..., 3:] / 255.0
+    alpha_canvas = 1.0 - alpha_img
+    for c in range(3):
+        dst[..., c] = alpha_img[..., 0] * src[..., c] + alpha_canvas[..., 0] * dst[..., c]
+    dst[..., 3] = np.maximum(src[..., 3], dst[..., 3])
+    return dst
+
+def over_alpha(dst_a, src_a):
+    """
+    over 公式的 float 参考值，用于校验新内核的透明度通道
+    """
+    a = src_a / 255.0
+    return np.rint((a + dst_a / 255.0 * (1.0 - a)) * 255.0)
+
+def random_stack(target, rng):
+    """
+    按“基础人物 → 表情 → 额外装饰 → 头发”的规则随机挑一组图层；头发只在该基础人物可搭配的范围内挑
+    """
+    manifest = get_manifest(target)
+    categories = manifest.categories
+    base = rng.choice(categories["基础人物"])
+    stack = [base, rng.choice(categories["表情"])]
+    stack += [i for i in categories["额外装饰"] if rng.random() < 0.3]
+    stack.append(rng.choice(manifest.hair_for(base)))
+    return stack
+
+def composite(target, stack, kernel, check=None):
+    """
+    在 PSD 原始画布上按 PSD 坐标叠加图层；check(before, layer) 在每层混合前调用
+    """
+    manifest = get_manifest(target)
+    canvas = np.zeros((PSD_SIZE[1], PSD_SIZE[0], 4), dtype=np.uint8)
+    for layer_id in stack:
+        layer = manifest.layers[layer_id]
+        image = layer_cache.get(layer.path)
+        h, w = image.shape[:2]
+        region = canvas[layer.top:layer.top + h, layer.left:layer.left + w]
+        if check is not None:
+            check(region.copy(), image)
+        kernel(region, image)
+    return canvas
+
+def check_accuracy(stacks):
+    """
+    逐层比对：同一块画布分别用两种实现混合同一图层
+    颜色允许 ±1（旧版截断、新版四舍五入）；透明度与 over 公式比对
+    """
+    worst = {"color": 0, "alpha": 0}
+
+    def check(before, image):
+        fixed = blend_over(before.copy(), image)
+        legacy = blend_over_float(before.copy(), image)
+        color = np.abs(fixed[..., :3].astype(np.int16) - legacy[..., :3].astype(np.int16)).max()
+        alpha = np.abs(fixed[..., 3] - over_alpha(before[..., 3], image[..., 3])).max()
+        worst["color"] = max(worst["color"], int(color))
+        worst["alpha"] = max(worst["alpha"], int(alpha))
+
+    for target, stack in stacks:
+        composite(target, stack, blend_over, check=check)
+        print(f"{target} {stack}: 已校验")
+    print(f"颜色最大误差 {worst['color']}（允许 1），透明度最大误差 {worst['alpha']}（允许 1）")
+    return worst["color"] <= 1 and worst["alpha"] <= 1
+
+def bench(target, stack, kernel, repeat):
+    """
+    返回（整次合成, 仅混合内核）耗时的中位数，单位 ms；整次合成包含 PSD 画布的分配
+    """
+    composite(target, stack, kernel)    # 预热：把图层放进解码缓存
+    kernel_time = [0.0]
+
+    def timed_kernel(dst, src):
+        t0 = time.perf_counter()
+        kernel(dst, src)
+        kernel_time[0] += time.perf_counter() - t0
+
+    totals, kernels = [], []
+    for _ in range(repeat):
+        kernel_time[0] = 0.0
+        t0 = time.perf_counter()
+        composite(target, stack, timed_kernel)
+        totals.append(time.perf_counter() - t0)
+        kernels.append(kernel_time[0])
+    totals.sort()
+    kernels.sort()
+    return totals[len(totals) // 2] * 1000, kernels[len(kernels) // 2] * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="混合内核精度校验 + 微基准")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    stacks = [("ムラサメb", [1717, 1475, 1261])]
+    stacks += [(target, random_stack(target, rng)) for target in ("ムラサメa", "ムラサメb") for _ in range(3)]
+
+    ok = check_accuracy(stacks)
+
+    target, stack = stacks[0]
+    legacy_total, legacy_kernel = bench(target, stack, blend_over_float, args.repeat)
+    fixed_total, fixed_kernel = bench(target, stack, blend_over, args.repeat)
+    print(f"{target} {stack} @ {PSD_SIZE[0]}x{PSD_SIZE[1]}（中位数，整次合成 / 仅混合）")
+    print(f"  float64 逐通道: {legacy_total:.1f} ms / {legacy_kernel:.1f} ms")
+    print(f"  uint16 定点:    {fixed_total:.1f} ms / {fixed_kernel:.1f} ms（混合 {legacy_kernel / fixed_kernel:.2f}x）")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
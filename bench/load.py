@@ -0,0 +1,337 @@
+# ==========================================
+# bench/load.py – 回复管线压测
+# 用法（项目根目录）：python -m bench.load [--turns 2000] [--users 8] [--mode stream|stages|fused]
+#                     [--server http://127.0.0.1:18080] [--latency reply=0.8:0.4] [--compare bench/results/xxx.json]
+# 不指定 --server 时在子进程中启动 bench.standin（替身服务器不与压测争用 GIL）
+# 在临时目录中搭建与项目相同的相对路径（config.json、参考音频、缓存），
+# 多个模拟用户各自维护对话历史，逐轮直接运行 LLMWorker.run()（与桌宠相同的代码路径）
+# 统计吞吐、整轮 / 首字 / 首句语音的 p50/p95/p99，以及各阶段、路由与缓存的统计
+# ==========================================
+
+import argparse
+import contextlib
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INVOKE_DIR = os.getcwd()      # 命令行里的相对路径以启动目录为准
+sys.path.insert(0, ROOT)
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from bench import standin
+from bench.sprites import RESULTS_DIR, git_commit, peak_rss_mb, percentile
+
+PROMPTS = (
+    ("主人摸了摸你的头", "system"),
+    ("丛雨，今天过得怎么样？", "user"),
+    ("你是幼刀吗？", "user"),
+    ("晚上想吃什么？芭菲怎么样？", "user"),
+    ("帮我想想周末去哪里玩吧。", "user"),
+    ("用户切换到了代码编辑器，开始编写程序。", "system"),
+)
+
+# 最后一句语音合成后再等多久（秒）才结束压测
+DRAIN_SECONDS = 2.0
+
+# -------------- 运行环境 ------------------
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(args) -> tuple:
+    """
+    在子进程中启动替身服务器，返回 (url, 进程)
+    """
+    port = free_port()
+    command = [sys.executable, "-m", "bench.standin", "--port", str(port),
+               "--tokens-per-second", str(args.tokens_per_second), "--error-rate", str(args.error_rate)]
+    for value in args.latency or ():
+        command += ["--latency", value]
+    if args.seed is not None:
+        command += ["--seed", str(args.seed)]
+    process = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        with contextlib.suppress(OSError), socket.create_connection(("127.0.0.1", port), timeout=0.2):
+            return f"http://127.0.0.1:{port}", process
+        time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("替身服务器启动失败")
+
+def make_sandbox(url: str, args) -> str:
+    """
+    临时目录：config.json、models/ 下的参考音频、fgimages 链接；返回其中的 src 目录
+    """
+    sandbox = tempfile.mkdtemp(prefix="murasame-load-")
+    os.makedirs(os.path.join(sandbox, "src"))
+    os.symlink(os.path.join(ROOT, "fgimages"), os.path.join(sandbox, "fgimages"))
+    for emotion in standin.EMOTIONS:
+        folder = os.path.join(sandbox, "models", "Murasame_SoVITS", "reference_voices", emotion)
+        os.makedirs(folder)
+        with open(os.path.join(folder, "ref.wav"), "wb") as f:
+            f.write(standin.make_wav("参考音频"))
+        with open(os.path.join(folder, "asr.txt"), "w", encoding="utf-8") as f:
+            f.write("吾輩はムラサメじゃ。")
+    raw = {
+        "endpoints": {
+            "base_url": f"{url}/v1", "api_key": "standin", "model_id": "standin-cloud",
+            "local_base_url": f"{url}/v1", "local_api_key": "standin", "local_model_id": "standin-local",
+            "sovits_base_url": f"{url}/tts",
+        },
+        "streaming": args.mode == "stream",
+        "fused": args.mode == "fused",
+        "network": {"pool_size": max(8, args.users * 4)},
+        "calls": {"workers": max(32, args.users * 4)},
+        "memo": {"enabled": args.memo},
+        # 替身服务器可并行合成
+        "voices": {"cache": args.memo, "workers": max(2, args.users), "streaming": args.stream_audio},
+    }
+    with open(os.path.join(sandbox, "config.json"), "w", encoding="utf-8") as f:
+        json.dump(raw, f, ensure_ascii=False, indent=2)
+    return os.path.join(sandbox, "src")
+
+# -------------- 模拟用户 ------------------
+class Turns:
+    """
+    全部用户共享的轮次计数与测量结果
+    """
+
+    def __init__(self, total: int):
+        self.remaining = total
+        self.lock = threading.Lock()
+        self.turn, self.first_token, self.first_voice = [], [], []
+        self.completed = self.errors = self.interrupted = 0
+        self.dead_users = 0
+        self.failures = []      # 前几个异常的 traceback，结束时打印
+        self.last_voice = time.perf_counter()
+
+    def take(self) -> bool:
+        with self.lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+    def fail(self, dead: bool = False):
+        """
+        在 except 块中调用：记一次出错并保存 traceback；dead 表示整个模拟用户线程已退出
+        """
+        with self.lock:
+            if dead:
+                self.dead_users += 1
+            else:
+                self.errors += 1
+            if len(self.failures) < 5:
+                self.failures.append(traceback.format_exc())
+
+def simulate_user(turns: Turns, rng: random.Random, interrupt_rate: float):
+    from PyQt5.QtCore import Qt
+    from src import chat
+    from src.main import LLMWorker
+    history, emotion_history, embeddings_history = chat.identity(), [], []
+    while turns.take():
+        prompt, role = rng.choice(PROMPTS)
+        event = threading.Event()
+        worker = LLMWorker(prompt, history, emotion_history, embeddings_history, role=role, interrupt_event=event)
+        marks = {}
+        t_start = time.perf_counter()
+
+        def mark(name):
+            marks.setdefault(name, time.perf_counter())
+
+        def on_voice(path, marks=marks, t_start=t_start):
+            # 非流式模式下语音可能在 finished 之后、甚至下一轮开始后才送达，计入发出它的那一轮
+            now = time.perf_counter()
+            with turns.lock:
+                if "first_voice" not in marks:
+                    marks["first_voice"] = now
+                    turns.first_voice.append(now - t_start)
+                turns.last_voice = now
+
+        def on_finished(response, new_history, new_emotion_history, new_embeddings_history, layers, translated):
+            nonlocal history, emotion_history, embeddings_history
+            mark("finished")
+            history, emotion_history, embeddings_history = \
+                new_history, new_emotion_history, new_embeddings_history
+
+        # 直接在本线程调用 run()，信号须直连，否则要等不存在的事件循环
+        worker.finished.connect(on_finished, Qt.DirectConnection)
+        worker.text_delta.connect(lambda text: mark("first_token"), Qt.DirectConnection)
+        worker.voice_ready.connect(on_voice, Qt.DirectConnection)
+        worker.audio_begin.connect(lambda on_voice=on_voice: on_voice(None), Qt.DirectConnection)
+        timer = None
+        if rng.random() < interrupt_rate:
+            # 模拟用户在回复中途输入新内容
+            timer = threading.Timer(rng.uniform(0.1, 2.0), event.set)
+            timer.start()
+        try:
+            worker.run()
+        except Exception:
+            turns.fail()
+            continue
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+        with turns.lock:
+            if "finished" in marks:
+                turns.completed += 1
+                turns.turn.append(marks["finished"] - t_start)
+                if "first_token" in marks:
+                    turns.first_token.append(marks["first_token"] - t_start)
+            elif event.is_set():
+                turns.interrupted += 1
+            else:
+                turns.errors += 1
+
+def run_user(turns: Turns, rng: random.Random, interrupt_rate: float):
+    try:
+        simulate_user(turns, rng, interrupt_rate)
+    except BaseException:
+        turns.fail(dead=True)
+
+def distribution(samples: list) -> dict:
+    if not samples:
+        return {"samples": 0}
+    return {"samples": len(samples),
+            "p50_s": round(percentile(samples, 50), 4),
+            "p95_s": round(percentile(samples, 95), 4),
+            "p99_s": round(percentile(samples, 99), 4),
+            "max_s": round(max(samples), 4)}
+
+def compare(results: dict, old_path: str):
+    with open(old_path, "r", encoding="utf-8") as f:
+        old = json.load(f)
+    print(f"\n对比 {old_path}（commit {old.get('commit')}）")
+    print(f"  throughput: {old['throughput']:>9.2f} → {results['throughput']:>9.2f} 轮/秒")
+    for key in ("turn", "first_token", "first_voice"):
+        for metric in ("p50_s", "p95_s", "p99_s"):
+            prev, now = old[key].get(metric), results[key].get(metric)
+            if prev is None or now is None:
+                continue
+            delta = (now - prev) / prev * 100 if prev else 0.0
+            print(f"  {key:<12} {metric}: {prev:>8.3f} → {now:>8.3f} s（{delta:+.1f}%）")
+
+def main():
+    parser = argparse.ArgumentParser(description="回复管线压测（替身服务器）")
+    parser.add_argument("--turns", type=int, default=2000, help="总轮数")
+    parser.add_argument("--users", type=int, default=8, help="并发的模拟用户数")
+    parser.add_argument("--mode", choices=("stream", "stages", "fused"), default="stream",
+                        help="stream：流式回复；stages：非流式 + 阶段依赖图；fused：合并请求")
+    parser.add_argument("--memo", action="store_true", help="启用翻译 / 情感 / 图层结果缓存与语音缓存（默认关闭，避免命中掩盖延迟）")
+    parser.add_argument("--stream-audio", action="store_true", help="流式语音合成（voices.streaming），首句语音按收到第一块计")
+    parser.add_argument("--interrupt-rate", type=float, default=0.0, help="回复中途被打断的轮次比例")
+    parser.add_argument("--server", help="使用已启动的替身服务器（如 http://127.0.0.1:18080），此时下列延迟参数无效")
+    standin.add_arguments(parser)
+    parser.add_argument("--compare", help="与之前的结果 JSON 对比")
+    parser.add_argument("--no-save", action="store_true", help="不写入 bench/results")
+    parser.add_argument("--keep", action="store_true", help="保留临时目录（日志、语音文件）")
+    args = parser.parse_args()
+
+    process = None
+    if args.server:
+        url = args.server.rstrip("/")
+    else:
+        url, process = start_server(args)
+    src_dir = make_sandbox(url, args)
+    os.chdir(src_dir)       # 资源路径均相对 src/，这里换成临时目录中的 src/
+
+    from PyQt5.QtCore import QCoreApplication
+    from src import stages
+    from src.memo import memo_cache
+    # 先在主线程导入一次：导入失败（如缺少 QtMultimedia）直接报错退出，而不是让每个模拟用户线程悄悄退出
+    try:
+        from src.main import LLMWorker
+    except BaseException:
+        if process is not None:
+            process.terminate()
+        raise
+    from src.router import router
+    from src.voicecache import voice_cache
+    app = QCoreApplication.instance() or QCoreApplication(sys.argv)
+
+    turns = Turns(args.turns)
+    rng = random.Random(args.seed)
+    users = [threading.Thread(target=run_user, name=f"user-{i}",
+                              args=(turns, random.Random(rng.random()), args.interrupt_rate))
+             for i in range(args.users)]
+    print(f"{url}：{args.turns} 轮，{args.users} 个用户，模式 {args.mode}", file=sys.stderr)
+    t_start = time.perf_counter()
+    # LLMWorker 逐轮打印耗时，压测期间不输出
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for user in users:
+            user.start()
+        while any(user.is_alive() for user in users):
+            time.sleep(1)
+            done = args.turns - turns.remaining
+            print(f"\r已开始 {done}/{args.turns} 轮，完成 {turns.completed}，出错 {turns.errors}",
+                  end="", file=sys.stderr)
+        elapsed = time.perf_counter() - t_start
+        # 流式模式下最后几轮的语音在 finished 之后仍在合成，等其结束再关闭服务器
+        while time.perf_counter() - turns.last_voice < DRAIN_SECONDS:
+            time.sleep(0.2)
+    print(file=sys.stderr)
+
+    results = {"commit": git_commit(), "time": datetime.now().isoformat(timespec="seconds"),
+               "python": sys.version.split()[0], "server": "external" if args.server else "standin",
+               "args": {key: value for key, value in vars(args).items() if key not in ("compare", "no_save", "keep")},
+               "elapsed_s": round(elapsed, 2),
+               "completed": turns.completed, "errors": turns.errors, "interrupted": turns.interrupted,
+               "dead_users": turns.dead_users,
+               "throughput": round(turns.completed / elapsed, 3),
+               "turn": distribution(turns.turn),
+               "first_token": distribution(turns.first_token),
+               "first_voice": distribution(turns.first_voice),
+               "stages": stages.latency.summary(),
+               "router": router.stats(),
+               "memo": memo_cache.stats(),
+               "voices": voice_cache.stats(),
+               "peak_rss_mb": peak_rss_mb()}
+
+    print(f"完成 {turns.completed} 轮（出错 {turns.errors}，被打断 {turns.interrupted}，"
+          f"异常退出的用户 {turns.dead_users}），"
+          f"用时 {elapsed:.1f} 秒，吞吐 {results['throughput']:.2f} 轮/秒")
+    print(f"{'metric':<12} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for key in ("turn", "first_token", "first_voice"):
+        row = results[key]
+        if row["samples"]:
+            print(f"{key:<12} {row['p50_s']:>8.3f} {row['p95_s']:>8.3f} {row['p99_s']:>8.3f} {row['max_s']:>8.3f}")
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"load-{datetime.now():%Y%m%d-%H%M%S}-{results['commit']}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存：{os.path.relpath(path, ROOT)}")
+    if args.compare:
+        compare(results, os.path.join(INVOKE_DIR, args.compare))
+
+    if process is not None:
+        process.terminate()
+    if args.keep:
+        print(f"临时目录：{os.path.dirname(src_dir)}")
+    else:
+        os.chdir(ROOT)
+        shutil.rmtree(os.path.dirname(src_dir), ignore_errors=True)
+    app.quit()
+
+    for failure in turns.failures:
+        print(failure, file=sys.stderr)
+    # 有模拟用户线程异常退出或一轮都没完成时，压测结果不可信
+    if turns.dead_users or not turns.completed:
+        print(f"压测失败：{turns.dead_users} 个模拟用户异常退出，完成 {turns.completed} 轮", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+# ==========================================
+# bench/sprites.py – 立绘管线基准测试
+# 用法（项目根目录）：python -m bench.sprites [--samples 40] [--compare bench/results/xxx.json]
+# 在 QT_QPA_PLATFORM=offscreen 下运行三条管线（每条管线的每个工作负载在单独的子进程中运行，内存峰值互不影响）：
+#   full    : generate_fgimage 原尺寸合成 → Pet.cvimg_to_qpixmap → 半尺寸平滑缩放（旧流程）
+#   display : generate_fgimage 按显示尺寸增量合成 → QPixmap（当前 render_sprite 流程）
+#   cached  : sprite.get_sprite 内存命中 → QPixmap
+# 工作负载：启动立绘、ムラサメa/b 随机合法组合、同一表情连续重复
+# 结果写入 bench/results/<时间>-<commit>.json，--compare 可与旧结果对比
+# ==========================================
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INVOKE_DIR = os.getcwd()      # 命令行里的相对路径以启动目录为准
+sys.path.insert(0, ROOT)
+os.chdir(os.path.join(ROOT, "src"))     # 资源路径均相对 src/
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QPixmap
+from PyQt5.QtWidgets import QApplication
+from src import generate, sprite
+from src.manifest import get_manifest
+
+RESULTS_DIR = os.path.join(ROOT, "bench", "results")
+SCALE = 0.5
+
+try:
+    import resource
+except ImportError:     # Windows 没有 resource 模块
+    resource = None
+
+# -------------- 管线 ------------------
+def cvimg_to_qpixmap(cv_img):
+    """
+    与 Pet.cvimg_to_qpixmap 相同的转换；main.py 导入时会读取 config.json，这里不直接导入
+    """
+    return QPixmap.fromImage(sprite.cvimg_to_qimage(cv_img))
+
+def run_full(target, layers):
+    pixmap = cvimg_to_qpixmap(generate.generate_fgimage(target, layers))
+    return pixmap.scaled(pixmap.width() // 2, pixmap.height() // 2,
+                         Qt.KeepAspectRatio, Qt.SmoothTransformation)
+
+def run_display(target, layers):
+    return QPixmap.fromImage(sprite.render_sprite(target, layers, SCALE))
+
+def run_cached(target, layers):
+    return QPixmap.fromImage(sprite.get_sprite(target, layers, SCALE))
+
+PIPELINES = {"full": run_full, "display": run_display, "cached": run_cached}
+
+# -------------- 工作负载 ------------------
+def make_workloads(samples: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    combos = {target: list(get_manifest(target).combinations()) for target in ("ムラサメa", "ムラサメb")}
+
+    # 同一基础人物下若干表情，每个表情连续出现 5 次
+    streak = []
+    base_combos = [c for c in combos["ムラサメb"] if c[0] == 1717]
+    while len(streak) < samples:
+        streak += [rng.choice(base_combos)] * 5
+
+    return {
+        "startup": [("ムラサメb", (1717, 1475, 1261))] * samples,
+        "random_a": [("ムラサメa", rng.choice(combos["ムラサメa"])) for _ in range(samples)],
+        "random_b": [("ムラサメb", rng.choice(combos["ムラサメb"])) for _ in range(samples)],
+        "streak_b": [("ムラサメb", combo) for combo in streak[:samples]],
+    }
+
+# -------------- 测量 ------------------
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+def measure(run, workload, alloc_samples: int) -> dict:
+    # 预热：解码缓存、mip 缓存
+    for target, layers in workload[:3]:
+        run(target, layers)
+
+    latencies = []
+    for target, layers in workload:
+        t0 = time.perf_counter()
+        run(target, layers)
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    # 分配量单独测：tracemalloc 会拖慢计时；只统计 Python/numpy 侧，Qt 内部分配不计入
+    alloc_peaks, alloc_blocks = [], []
+    tracemalloc.start()
+    for target, layers in workload[:alloc_samples]:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        run(target, layers)
+        alloc_peaks.append(tracemalloc.get_traced_memory()[1] - base)
+        stats = tracemalloc.take_snapshot().compare_to(before, "lineno")
+        alloc_blocks.append(sum(max(s.count_diff, 0) for s in stats))
+    tracemalloc.stop()
+
+    return {
+        "samples": len(latencies),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+        "alloc_peak_mb": round(sum(alloc_peaks) / len(alloc_peaks) / 1024 ** 2, 3),
+        "alloc_blocks": round(sum(alloc_blocks) / len(alloc_blocks), 1),
+    }
+
+def peak_rss_mb():
+    """
+    本进程的内存峰值（含 Qt 内部分配）；历史最高值，所以每个管线 / 工作负载单独一个子进程
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024   # macOS 单位为字节，Linux 为 KB
+
+def measure_isolated(pipeline: str, name: str, samples: int, alloc_samples: int, seed: int) -> dict:
+    """
+    子进程：测一个管线在一个工作负载下的表现，附上本进程的内存峰值与缓存统计
+    """
+    app = QApplication.instance() or QApplication(sys.argv)
+    # 不读写磁盘缓存和图集，结果可复现
+    sprite.sprite_cache.configure(max_entries=64, disk=False, atlas=False)
+    row = measure(PIPELINES[pipeline], make_workloads(samples, seed)[name], alloc_samples)
+    row["peak_rss_mb"] = peak_rss_mb()
+    row["layer_cache"] = generate.layer_cache.stats()
+    row["sprite_cache"] = sprite.sprite_cache.stats()
+    app.quit()
+    return row
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def compare(results: dict, old_path: str):
+    with open(old_path, "r", encoding="utf-8") as f:
+        old = json.load(f)
+    print(f"\n对比 {old_path}（commit {old.get('commit')}）")
+    for key, row in results["results"].items():
+        prev = old["results"].get(key)
+        if prev is None:
+            continue
+        for metric in ("p50_ms", "p95_ms"):
+            delta = (row[metric] - prev[metric]) / prev[metric] * 100 if prev[metric] else 0.0
+            print(f"  {key:<20} {metric}: {prev[metric]:>9.2f} → {row[metric]:>9.2f} ms（{delta:+.1f}%）")
+        if row.get("peak_rss_mb") is not None and prev.get("peak_rss_mb") is not None:
+            print(f"  {key:<20} peak_rss_mb: {prev['peak_rss_mb']:>6.0f} → {row['peak_rss_mb']:>6.0f} MB")
+
+def main():
+    parser = argparse.ArgumentParser(description="立绘管线基准测试")
+    parser.add_argument("--samples", type=int, default=40, help="每个工作负载的样本数")
+    parser.add_argument("--alloc-samples", type=int, default=5, help="统计分配量的样本数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--pipelines", nargs="+", default=list(PIPELINES), choices=list(PIPELINES))
+    parser.add_argument("--compare", help="与之前的结果 JSON 对比")
+    parser.add_argument("--no-save", action="store_true", help="不写入 bench/results")
+    args = parser.parse_args()
+
+    workloads = make_workloads(args.samples, args.seed)
+    results = {"commit": git_commit(), "time": datetime.now().isoformat(timespec="seconds"),
+               "python": sys.version.split()[0], "samples": args.samples, "seed": args.seed, "results": {}}
+
+    print(f"{'pipeline/workload':<20} {'p50':>9} {'p95':>9} {'alloc MB':>9} {'blocks':>8} {'RSS MB':>8}")
+    spawn = multiprocessing.get_context("spawn")
+    for pipeline in args.pipelines:
+        for name in workloads:
+            # 每次一个新的子进程：进程内存峰值只属于这一个管线 / 工作负载
+            with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as pool:
+                row = pool.submit(measure_isolated, pipeline, name,
+                                  args.samples, args.alloc_samples, args.seed).result()
+            key = f"{pipeline}/{name}"
+            results["results"][key] = row
+            rss = f"{row['peak_rss_mb']:.0f}" if row["peak_rss_mb"] is not None else "-"
+            print(f"{key:<20} {row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} "
+                  f"{row['alloc_peak_mb']:>9.2f} {row['alloc_blocks']:>8.0f} {rss:>8}")
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{results['commit']}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存：{os.path.relpath(path, ROOT)}")
+    if args.compare:
+        compare(results, os.path.join(INVOKE_DIR, args.compare))
+
+if __name__ == "__main__":
+    main()
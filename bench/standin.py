@@ -0,0 +1,311 @@
+# ==========================================
+# bench/standin.py – 离线替身服务器
+# 用法（项目根目录）：python -m bench.standin [--port 18080] [--latency reply=0.8:0.4] [--error-rate 0.01]
+# 实现本项目用到的接口子集，无需云端密钥与 GPT-SoVITS 即可跑通 chat.py / LLMWorker：
+#   POST /v1/chat/completions ：普通、流式（SSE）、thinking（先输出 reasoning_content）、结构化输出（response_format）
+#   POST /tts                 ：SoVITS 的 TTS 接口，返回按文本长度生成的 WAV；streaming_mode 时按句分块返回
+# 按系统提示词识别请求类型（回复、翻译、情感、图层……），各类型的延迟服从可配置的对数正态分布
+# ==========================================
+
+import argparse
+import io
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 各请求类型的默认延迟：(中位数秒, 对数标准差)；流式回复为首字延迟
+DEFAULT_LATENCY = {
+    "reply": (0.8, 0.4), "fused": (1.2, 0.4), "judge": (0.6, 0.3), "vision": (1.0, 0.3),
+    "summary": (0.5, 0.3), "translate": (0.3, 0.3), "emotion": (0.2, 0.3), "layers": (0.3, 0.3),
+    "tts": (0.4, 0.3),
+}
+
+# 系统提示词关键字 → 请求类型
+KIND_MARKERS = (
+    ("翻译助手", "translate"), ("情感分析助手", "emotion"), ("立绘图层生成助手", "layers"),
+    ("对话总结助手", "summary"), ("视觉识别助手", "vision"), ("思考助手", "judge"),
+)
+
+EMOTIONS = ("害羞", "平静", "惊讶", "生气", "着急", "高兴")
+
+REPLIES = (
+    "哼，本座才不是幼刀呢！主人真是的。下次再这么说，本座就不理你了。",
+    "唔……摸头什么的，本座又不是小孩子！不过，也不是不可以啦。",
+    "主人今天也辛苦了呢。要不要一起吃芭菲？本座请客哦！",
+    "诶？那、那边是不是有什么东西在动……主人，本座才没有害怕！",
+)
+
+# 与 manifest.BASE_HAIR 相同：ムラサメa 的基础人物必须搭配对应头发
+BASE_HAIR = {1957: 1959, 1956: 1959, 1979: 1959, 1978: 1959,
+             1953: 1959, 1952: 1959, 1951: 1273, 1950: 1273}
+
+class Behaviour:
+    """
+    替身服务器的行为参数：各类型延迟分布、流式输出速度、出错率
+    """
+
+    def __init__(self, latency: dict, tokens_per_second: float, error_rate: float, seed=None):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {}
+
+    def delay(self, kind: str) -> float:
+        median, sigma = self.latency[kind]
+        with self.lock:
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+            return median * math.exp(sigma * self.rng.gauss(0, 1))
+
+    def fail(self) -> bool:
+        with self.lock:
+            return self.rng.random() < self.error_rate
+
+    def choice(self, items):
+        with self.lock:
+            return self.rng.choice(items)
+
+# -------------- 生成内容 ------------------
+def _text(message: dict) -> str:
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content
+
+def classify(body: dict) -> str:
+    response_format = body.get("response_format") or {}
+    schema = response_format.get("json_schema", {}).get("schema", {})
+    if "layers" in schema.get("properties", {}):
+        return "fused"
+    system = "".join(_text(m) for m in body.get("messages", []) if m.get("role") == "system")
+    for marker, kind in KIND_MARKERS:
+        if marker in system:
+            return kind
+    return "reply"
+
+def pick_layers(prompt: str, behaviour: Behaviour) -> list:
+    """
+    从提示词中的图层说明（“分类 >> id：说明；...”）随机挑一个合法组合
+    """
+    categories = {}
+    for category, items in re.findall(r"^(\S+) >> (.+)$", prompt, re.M):
+        categories[category] = [int(i) for i in re.findall(r"(\d+)：", items)]
+    base = behaviour.choice(categories.get("基础人物", [1717]))
+    expression = behaviour.choice(categories.get("表情", [1475]))
+    hair = BASE_HAIR.get(base) or behaviour.choice(categories.get("头发", [1261]))
+    return [base, expression, hair]
+
+def make_content(kind: str, body: dict, behaviour: Behaviour) -> str:
+    system = "".join(_text(m) for m in body.get("messages", []) if m.get("role") == "system")
+    if kind == "translate":
+        return "ふん、吾輩は幼刀などではないぞ！ご主人は本当に仕方のない奴じゃ。"
+    if kind == "emotion":
+        return behaviour.choice(EMOTIONS)
+    if kind == "layers":
+        return json.dumps(pick_layers(system, behaviour))
+    if kind == "summary":
+        return "主人和丛雨聊了日常琐事，丛雨抱怨被叫作幼刀，主人答应下次请她吃芭菲。"
+    if kind == "vision":
+        return "用户正在浏览器中阅读一篇技术文档。"
+    if kind == "judge":
+        return json.dumps({"des": behaviour.choice([None, "用户切换到了代码编辑器，开始编写程序。"])},
+                          ensure_ascii=False)
+    reply = behaviour.choice(REPLIES)
+    if kind == "fused":
+        return json.dumps({"reply": reply, "translation": make_content("translate", body, behaviour),
+                           "emotion": behaviour.choice(EMOTIONS), "layers": pick_layers(system, behaviour)},
+                          ensure_ascii=False)
+    return reply
+
+SAMPLE_RATE = 32000
+
+def make_pcm(text: str) -> bytes:
+    """
+    按文本长度生成静音 PCM（16 位单声道，每字 0.15 秒，最长 10 秒）
+    """
+    return b"\0\0" * int(min(10.0, 0.15 * max(1, len(text))) * SAMPLE_RATE)
+
+def make_wav(text: str = None) -> bytes:
+    """
+    text 为 None 时只有文件头（长度为 0），与 SoVITS 流式输出的第一块相同
+    """
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(b"" if text is None else make_pcm(text))
+    return buffer.getvalue()
+
+# -------------- HTTP ------------------
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"       # 保持长连接，与真实接口一样可以复用连接
+    behaviour: Behaviour = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path.rstrip("/").endswith("/chat/completions"):
+            self.chat(body)
+        elif self.path.rstrip("/").endswith("/tts"):
+            self.tts(body)
+        else:
+            self.send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+
+    def send_json(self, status: int, payload: dict):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def chat(self, body: dict):
+        kind = classify(body)
+        time.sleep(self.behaviour.delay(kind))
+        if self.behaviour.fail():
+            self.send_json(500, {"error": {"message": "injected failure", "type": "server_error"}})
+            return
+        content = make_content(kind, body, self.behaviour)
+        thinking = (body.get("thinking") or {}).get("type") == "enabled"
+        base = {"id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "created": int(time.time()),
+                "model": body.get("model", "standin")}
+        if body.get("stream"):
+            self.stream(base, content, thinking)
+            return
+        message = {"role": "assistant", "content": content}
+        if thinking:
+            message["reasoning_content"] = "（思考过程）"
+        tokens = len(content)
+        self.send_json(200, {**base, "object": "chat.completion",
+                             "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+                             "usage": {"prompt_tokens": 0, "completion_tokens": tokens, "total_tokens": tokens}})
+
+    def stream(self, base: dict, content: str, thinking: bool):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        interval = 2 / self.behaviour.tokens_per_second     # 每块约 2 个字
+
+        def send(delta: dict, finish_reason=None):
+            chunk = {**base, "object": "chat.completion.chunk",
+                     "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            self.write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+        try:
+            if thinking:
+                send({"role": "assistant", "reasoning_content": "（思考过程）"})
+            for i in range(0, len(content), 2):
+                send({"content": content[i:i + 2]})
+                time.sleep(interval)
+            send({}, "stop")
+            self.write_chunk(b"data: [DONE]\n\n")
+            self.write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            pass        # 客户端中途关闭（被打断）
+
+    def write_chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def tts(self, body: dict):
+        text = body.get("text", "")
+        if body.get("streaming_mode"):
+            self.tts_stream(text)
+            return
+        time.sleep(self.behaviour.delay("tts") + 0.01 * len(text))
+        if self.behaviour.fail():
+            self.send_json(500, {"message": "injected failure"})
+            return
+        data = make_wav(text)
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/wav")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def tts_stream(self, text: str):
+        """
+        与 api_v2 的流式输出相同：先是文件头，之后按句（cut1）逐段返回 PCM
+        首段前等待 tts 延迟，之后每段按字数等待
+        """
+        time.sleep(self.behaviour.delay("tts"))
+        if self.behaviour.fail():
+            self.send_json(500, {"message": "injected failure"})
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/wav")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            self.write_chunk(make_wav())
+            for segment in re.findall(r"[^。！？!?]+[。！？!?]*", text) or [text]:
+                time.sleep(0.01 * len(segment))
+                self.write_chunk(make_pcm(segment))
+            self.write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+def parse_latency(values) -> dict:
+    """
+    ["reply=0.8:0.4", "tts=0.2"] → 覆盖 DEFAULT_LATENCY 的对应项
+    """
+    latency = dict(DEFAULT_LATENCY)
+    for value in values or ():
+        kind, _, spec = value.partition("=")
+        if kind not in latency:
+            raise ValueError(f"未知的请求类型：{kind}（可选 {', '.join(latency)}）")
+        median, _, sigma = spec.partition(":")
+        latency[kind] = (float(median), float(sigma) if sigma else latency[kind][1])
+    return latency
+
+def serve(port: int, behaviour: Behaviour, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """
+    启动替身服务器（后台线程），返回 server，server.shutdown() 停止
+    """
+    handler = type("StandinHandler", (Handler,), {"behaviour": behaviour})
+    server_class = type("StandinServer", (ThreadingHTTPServer,), {"request_queue_size": 256, "daemon_threads": True})
+    server = server_class((host, port), handler)
+    threading.Thread(target=server.serve_forever, name="standin", daemon=True).start()
+    return server
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency", action="append", metavar="KIND=MEDIAN[:SIGMA]",
+                        help=f"某类请求的延迟（秒，对数正态），可重复；类型：{', '.join(DEFAULT_LATENCY)}")
+    parser.add_argument("--tokens-per-second", type=float, default=40, help="流式输出速度（字/秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 的比例")
+    parser.add_argument("--seed", type=int, default=None)
+
+def behaviour_from_args(args) -> Behaviour:
+    return Behaviour(parse_latency(args.latency), args.tokens_per_second, args.error_rate, args.seed)
+
+def main():
+    parser = argparse.ArgumentParser(description="chat.py 与 GPT-SoVITS 的离线替身服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18080)
+    add_arguments(parser)
+    args = parser.parse_args()
+    server = serve(args.port, behaviour_from_args(args), args.host)
+    url = f"http://{args.host}:{args.port}"
+    print(f"替身服务器已启动：{url}")
+    print(f"config.json 中可设置 base_url / local_base_url 为 {url}/v1，sovits_base_url 为 {url}/tts")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        sys.exit(0)
+
+if __name__ == "__main__":
+    main()
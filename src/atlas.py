@@ -0,0 +1,111 @@
+# ==========================================
+# atlas.py – 立绘图集文件格式
+# 预先合成好的立绘打包成单个文件，运行时用 mmap 打开
+# 布局：64 字节文件头 | 按 64 字节对齐的像素块 ... | JSON 索引
+# 像素块为显示尺寸、预乘 alpha 的 32 位行数据，可直接作为 QImage 的缓冲区
+# ==========================================
+
+import json
+import mmap
+import os
+import struct
+from .utils import log
+
+ATLAS_DIR = "../cache/atlas"
+ATLAS_MAGIC = b"MRSA"
+ATLAS_VERSION = 2
+
+# 文件头：magic, 版本, 索引偏移, 索引长度（其余填 0 至 64 字节）
+HEADER = struct.Struct("<4sIQQ")
+HEADER_SIZE = 64
+ALIGN = 64
+
+def atlas_path(target: str, scale: float) -> str:
+    return f"{ATLAS_DIR}/{target}@{scale}.atlas"
+
+def atlas_key(embeddings_layers) -> str:
+    return ",".join(str(int(i)) for i in embeddings_layers)
+
+# -------------- 写入 ------------------
+class AtlasWriter:
+    """
+    顺序写入图集：先写像素块，最后写索引并回填文件头；完成后原子替换目标文件
+    meta: 写入索引的附加信息（target、缩放、像素格式等），读取时原样返回
+    """
+
+    def __init__(self, path: str, meta: dict):
+        self.path = path
+        self.meta = meta
+        self.entries = {}
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._tmp_path = f"{path}.tmp"
+        self._file = open(self._tmp_path, "wb")
+        self._file.write(b"\0" * HEADER_SIZE)
+
+    def add(self, key: str, width: int, height: int, stride: int, data: bytes):
+        offset = self._file.tell()
+        self._file.write(data)
+        self._file.write(b"\0" * (-self._file.tell() % ALIGN))
+        self.entries[key] = [offset, width, height, stride]
+
+    def close(self):
+        index = json.dumps({"meta": self.meta, "entries": self.entries}, ensure_ascii=False).encode("utf-8")
+        index_offset = self._file.tell()
+        self._file.write(index)
+        self._file.seek(0)
+        self._file.write(HEADER.pack(ATLAS_MAGIC, ATLAS_VERSION, index_offset, len(index)))
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        self._file.close()
+        os.remove(self._tmp_path)
+
+# -------------- 读取 ------------------
+class SpriteAtlas:
+    """
+    只读打开的图集；lookup() 返回的 memoryview 直接引用映射内存，图集关闭前一直有效
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, index_offset, index_length = HEADER.unpack_from(self._mm, 0)
+        if magic != ATLAS_MAGIC:
+            self._mm.close()
+            raise ValueError(f"不是立绘图集：{path}")
+        if version != ATLAS_VERSION:
+            self._mm.close()
+            raise ValueError(f"图集版本 {version} 与当前版本 {ATLAS_VERSION} 不符，请重新烘焙：{path}")
+        index = json.loads(self._mm[index_offset:index_offset + index_length].decode("utf-8"))
+        self.path = path
+        self.meta = index["meta"]
+        self.entries = index["entries"]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def lookup(self, key: str):
+        """
+        返回 (width, height, stride, memoryview)；不存在时返回 None
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        offset, width, height, stride = entry
+        return width, height, stride, memoryview(self._mm)[offset:offset + stride * height]
+
+def open_atlas(path: str):
+    """
+    打开图集；文件不存在或格式不符时返回 None
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        return SpriteAtlas(path)
+    except (OSError, ValueError) as e:
+        log(f"立绘图集无法打开：{e}", "warning")
+        return None
@@ -0,0 +1,68 @@
+# ==========================================
+# bake.py – 立绘预烘焙
+# 枚举全部合法图层组合，多进程合成并写入单个图集文件
+# 用法（项目根目录）：python -m src.generate bake [--target ムラサメb] [--scale 0.5]
+# ==========================================
+
+import argparse
+import multiprocessing
+import os
+import time
+from functools import partial
+from .atlas import AtlasWriter, atlas_key, atlas_path
+from .manifest import TARGETS, get_manifest
+from .sprite import atlas_meta, render_sprite
+from .utils import log
+
+def _render(target: str, scale: float, combo):
+    """
+    子进程：合成一张立绘，返回 (combo, 宽, 高, 行字节数, 像素)
+    """
+    qimg = render_sprite(target, combo, scale)     # 已是预乘 alpha 的显示格式
+    bits = qimg.constBits()
+    bits.setsize(qimg.sizeInBytes())
+    return combo, qimg.width(), qimg.height(), qimg.bytesPerLine(), bytes(bits)
+
+def bake(target: str, scale: float, decorations: bool = True, bases=None, processes=None) -> str:
+    """
+    烘焙 target 的全部合法组合，返回图集路径
+    """
+    manifest = get_manifest(target)
+    combos = [combo for combo in manifest.combinations(decorations)
+              if not bases or combo[0] in bases]
+    if not combos:
+        raise ValueError("没有可烘焙的图层组合")
+
+    # 画布尺寸只取决于图层坐标，可以在合成前估算图集大小
+    estimate = sum(int(w * scale) * int(h * scale) * 4
+                   for w, h in (manifest.canvas_size(combo) for combo in combos))
+    log(f"{target} 共 {len(combos)} 种组合，缩放 {scale}，图集约 {estimate / 1024 ** 3:.2f} GB", "info")
+
+    path = atlas_path(target, scale)
+    writer = AtlasWriter(path, atlas_meta(target, scale))
+    t_start = time.time()
+    try:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.imap(partial(_render, target, scale), combos, chunksize=4)
+            for done, (combo, width, height, stride, data) in enumerate(results, 1):
+                writer.add(atlas_key(combo), width, height, stride, data)
+                if done % 50 == 0 or done == len(combos):
+                    log(f"已烘焙 {done}/{len(combos)}，用时 {time.time() - t_start:.1f} 秒", "info")
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+    log(f"图集已写入 {path}（{os.path.getsize(path) / 1024 ** 2:.1f} MB）", "info")
+    return path
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m src.generate bake",
+                                     description="预烘焙全部合法立绘组合到图集文件")
+    parser.add_argument("--target", default="ムラサメb", choices=TARGETS)
+    parser.add_argument("--scale", type=float, default=0.5, help="显示缩放，需与运行时一致（默认 0.5）")
+    parser.add_argument("--no-decorations", action="store_true", help="不枚举额外装饰，图集约为完整版的 1/4")
+    parser.add_argument("--bases", type=int, nargs="+", help="只烘焙指定的基础人物")
+    parser.add_argument("--processes", type=int, default=None, help="进程数（默认全部 CPU 核心）")
+    args = parser.parse_args(argv)
+    bake(args.target, args.scale, decorations=not args.no_decorations,
+         bases=args.bases, processes=args.processes)
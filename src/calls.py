@@ -0,0 +1,164 @@
+# ==========================================
+# calls.py – 外部调用的期限、取消与重试
+# execute(kind, fn) 为一次模型 / TTS 调用加上：
+#   按调用类型的总期限（超时后放弃，请求本身也带上剩余时间作为超时）
+#   与中断事件绑定的取消：事件一旦置位，等待中的调用立即返回，不必等请求结束
+#   有上限、带随机抖动的指数退避重试（只对连不上、超时一类的错误）
+# 中断事件通过 cancel_scope() 绑定到当前线程；提交到线程池的任务用 submit() 带上它
+# ==========================================
+
+import contextvars
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from .config import current as current_config
+from .utils import log
+
+# 各调用类型的默认总期限（秒），可在 config.json 的 calls.deadlines 中覆盖
+DEADLINES = {
+    "reply": 120, "stream": 120, "fused": 120, "judge": 120,
+    "vision": 60, "summary": 60, "tts": 60,
+    "translate": 20, "layers": 20, "emotion": 15,
+}
+DEFAULT_DEADLINE = 60
+
+# 等待期间检查中断事件的间隔（秒）
+POLL_INTERVAL = 0.05
+
+_cancel_event = contextvars.ContextVar("cancel_event", default=None)
+
+# 调用在这里的线程中执行，调用方只负责等待，因此可以随时放弃
+# 被放弃的请求无法强行停止，仍占着线程与连接，直到它自身的超时（不超过放弃时剩余的期限）；
+# 线程数按 calls.workers 设置，留出余量，避免新的调用排在这些请求后面
+_executor = None
+_executor_lock = threading.Lock()
+
+class Cancelled(Exception):
+    """
+    中断事件已置位，调用被放弃
+    """
+
+class DeadlineExceeded(TimeoutError):
+    """
+    超过调用类型的总期限
+    """
+
+@contextmanager
+def cancel_scope(event: threading.Event):
+    """
+    在 with 块内，当前线程发起的调用都与 event 绑定
+    """
+    token = _cancel_event.set(event)
+    try:
+        yield
+    finally:
+        _cancel_event.reset(token)
+
+def cancelled() -> bool:
+    event = _cancel_event.get()
+    return event is not None and event.is_set()
+
+def check_cancelled():
+    if cancelled():
+        raise Cancelled()
+
+@contextmanager
+def on_cancel(callback):
+    """
+    with 块执行期间中断事件一旦置位就调用 callback（用于关闭进行中的流式响应）
+    """
+    event = _cancel_event.get()
+    if event is None:
+        yield
+        return
+    finished = threading.Event()
+
+    def watch():
+        while not finished.wait(POLL_INTERVAL):
+            if event.is_set():
+                callback()
+                return
+
+    threading.Thread(target=watch, name="cancel-watch", daemon=True).start()
+    try:
+        yield
+    finally:
+        finished.set()
+
+def _pool() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=current_config().calls.workers, thread_name_prefix="call")
+        return _executor
+
+def close_result(future):
+    """
+    被放弃的请求返回后，关闭它持有的连接（流式响应等）；普通结果没有 close，直接丢弃
+    用作 future.add_done_callback 的回调
+    """
+    if future.cancelled() or future.exception() is not None:
+        return
+    close = getattr(future.result(), "close", None)
+    if close is not None:
+        close()
+
+def submit(pool: ThreadPoolExecutor, fn, *args, **kwargs):
+    """
+    pool.submit，但任务在提交者的上下文中运行（继承 cancel_scope）
+    """
+    return pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+def deadline_for(kind: str) -> float:
+    return current_config().calls.deadlines.get(kind, DEADLINES.get(kind, DEFAULT_DEADLINE))
+
+def retry_delay(attempt: int) -> float:
+    """
+    第 attempt 次重试前的等待：全抖动指数退避，上限 8 秒
+    """
+    backoff = current_config().calls.backoff
+    return random.uniform(0, min(8.0, backoff * 2 ** attempt))
+
+def execute(kind: str, fn, retry_on=()):
+    """
+    fn(remaining) 发出实际请求，remaining 为剩余期限（秒），应作为请求的超时
+    retry_on 中的异常按退避重试，最多 calls.retries 次；期限用完或被中断时抛出 DeadlineExceeded / Cancelled
+    """
+    event = _cancel_event.get()
+    deadline = time.monotonic() + deadline_for(kind)
+    retries = current_config().calls.retries
+    attempt = 0
+    while True:
+        check_cancelled()
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"{kind} 调用超过 {deadline_for(kind)} 秒期限")
+        future = submit(_pool(), fn, remaining)
+        try:
+            return _wait(future, event, deadline, kind)
+        except retry_on as e:
+            if attempt >= retries:
+                raise
+            delay = min(retry_delay(attempt), max(0.0, deadline - time.monotonic()))
+            attempt += 1
+            log(f"{kind} 调用失败（{e}），{delay:.1f} 秒后第 {attempt} 次重试", "warning")
+            if event is not None and event.wait(delay):
+                raise Cancelled()
+            if event is None:
+                time.sleep(delay)
+
+def _wait(future, event, deadline: float, kind: str):
+    while True:
+        remaining = deadline - time.monotonic()
+        done, _ = wait([future], timeout=max(0.0, min(POLL_INTERVAL if event else remaining, remaining)))
+        if done:
+            return future.result()
+        if event is not None and event.is_set():
+            # 请求线程不能强行停止：放弃等待，请求随自身超时结束，返回后立即关闭连接
+            future.add_done_callback(close_result)
+            raise Cancelled()
+        if time.monotonic() >= deadline:
+            future.add_done_callback(close_result)
+            raise DeadlineExceeded(f"{kind} 调用超过 {deadline_for(kind)} 秒期限")
@@ -1,33 +1,29 @@
 # ==========================================
 # chat.py – OpenAI API 对接模块
-# 提供：人设、翻译、情感、立绘图层、TTS、句子分割
+# 提供：人设、对话（含流式）、翻译、情感、立绘图层、TTS、句子分割
 # ==========================================
 
-import os
-import requests
+import json
 import base64
-import hashlib
-import pyautogui
-from openai import OpenAI
-from pydantic import BaseModel
-from .utils import get_config
-
-# 读取配置文件 config.json
-BASE = get_config()['endpoints']['base_url']
-API_KEY = get_config()['endpoints']['api_key']
-MODEL_NAME = get_config()['endpoints']['model_id']
-LOCAL_BASE = get_config()['endpoints']['local_base_url']
-LOCAL_API_KEY = get_config()['endpoints']['local_api_key']
-LOCAL_MODEL_NAME = get_config()['endpoints']['local_model_id']
-
-# 各模型对应的 ollama 生成接口
-pet_sovits_endpoint = get_config()['endpoints']['sovits_base_url']
-
-# 初始化客户端，从 config.json 中读取 Base URL 和 API Key
-client = OpenAI(
-    base_url=f"{BASE}",
-    api_key=f"{API_KEY}",
-)
+import time
+import threading
+import requests
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Literal, Optional
+from pydantic import BaseModel, ValidationError
+from openai import ContentFilterFinishReasonError, LengthFinishReasonError
+from . import calls
+from .clients import registry
+from .router import router
+from .config import current as current_config
+from .manifest import get_manifest, LAYER_EXAMPLES
+from .memo import memo_cache
+from .references import reference_voices
+from .voicecache import complete_wav, voice_cache, voice_key
+from .utils import log
+
+# 接口地址与模型名在每次调用时从配置快照读取，config.json 修改后无需重启
 
 # -------------- 人设 ------------------
 def identity():
@@ -40,40 +36,139 @@ def chat_with_pet(sentence: str, message_history):
     """
     桌宠对话函数。
     """
-    client = OpenAI(
-        base_url=f"{BASE}",
-        api_key=f"{API_KEY}",
-    )
-    message_history.append({"role": "user", "content": sentence})
+    reply, _ = query(sentence, message_history, role="user")
+    return reply
 
-    response = client.chat.completions.create(
-        model=f"{MODEL_NAME}",
-        messages=message_history,
+def query(prompt: str, history: list, role: str = "user"):
+    """
+    一次性取回完整回复；history 原地追加本轮的输入与回复
+    返回 (reply, history)
+    """
+    history.append({"role": role, "content": prompt})
+
+    response = router.call("reply", lambda client, model: client.chat.completions.create(
+        model=model,
+        messages=history,
         extra_body={
             "thinking": {
                 "type": "enabled",  # 使用深度思考能力
             }
         },
-    )
-    reply = response.choices[0].message.content                 # 将 AI 回复的内容保存到 reply 变量
-    message_history.append({"role": "user", "content": reply})  # 将 AI 回复的内容添加到对话历史记录
+    ))
+    reply = response.choices[0].message.content
+    history.append({"role": "assistant", "content": reply})
+    return reply, history
 
-    return reply
+def stream_query(prompt: str, history: list, role: str = "user"):
+    """
+    流式对话：逐块 yield 回复文本（深度思考的 reasoning 部分不输出）
+    生成器正常结束后，history 原地追加本轮的输入与完整回复；中途放弃则不写入回复
+    """
+    history.append({"role": role, "content": prompt})
+
+    stream = router.call("stream", lambda client, model: client.chat.completions.create(
+        model=model,
+        messages=history,
+        stream=True,
+        extra_body={
+            "thinking": {
+                "type": "enabled",  # 与 query 保持一致
+            }
+        },
+    ))
+    parts = []
+    try:
+        # 中断时从另一线程关闭响应，正在等待的读取立即结束
+        with calls.on_cancel(stream.close):
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
+    except Exception:
+        if calls.cancelled():
+            raise calls.Cancelled() from None
+        raise
+    finally:
+        stream.close()      # 提前放弃时立即断开，不再继续生成
+    calls.check_cancelled()
+    history.append({"role": "assistant", "content": "".join(parts)})
+
+def summarize_history(messages: list, previous: str = None) -> str:
+    """
+    把较早的几轮对话总结成一段摘要（供 history 模块在后台调用）
+    previous: 已有的更早摘要，一并融合进新摘要
+    """
+    speakers = {"user": "主人", "assistant": "丛雨", "system": "系统"}
+    lines = [f"{speakers.get(m['role'], m['role'])}：{m['content']}" for m in messages
+             if isinstance(m["content"], str)]
+    if previous:
+        lines.insert(0, f"更早的摘要：{previous}")
+    response = router.call("summary", lambda client, model: client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": "你是一个对话总结助手。用户会提供丛雨与主人的一段对话记录，请用简洁的中文第三人称总结其中的关键事实、主人的偏好和约定、以及双方情绪的变化，不超过 200 字。只返回总结内容。"},
+            {"role": "user", "content": "\n".join(lines)},
+        ],
+        extra_body={
+            "thinking": {
+                "type": "disabled",  # 不使用深度思考能力
+            }
+        },
+    ))
+    return response.choices[0].message.content.strip()
+
+# -------------- 句子分割 ------------------
+SENTENCE_ENDS = "。！？!?…～~\n"
+SENTENCE_CLOSERS = "」』）)”"
+
+class SentenceSplitter:
+    """
+    把流式文本切成完整的句子：feed() 返回新凑齐的句子，flush() 返回剩余部分
+    句末标点后紧跟的标点或右括号归入同一句；短于 min_length 的句子并入下一句
+    """
+
+    def __init__(self, min_length: int = 4):
+        self.min_length = min_length
+        self._buffer = ""
+
+    def feed(self, delta: str) -> list[str]:
+        self._buffer += delta
+        sentences = []
+        start = 0
+        i = 0
+        while i < len(self._buffer):
+            if self._buffer[i] not in SENTENCE_ENDS:
+                i += 1
+                continue
+            end = i + 1
+            while end < len(self._buffer) and self._buffer[end] in SENTENCE_ENDS + SENTENCE_CLOSERS:
+                end += 1
+            if end == len(self._buffer):
+                break       # 后面可能还有标点，等下一块再定
+            sentence = self._buffer[start:end].strip()
+            if len(sentence) >= self.min_length:
+                sentences.append(sentence)
+                start = end
+            i = end
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self) -> list[str]:
+        sentence, self._buffer = self._buffer.strip(), ""
+        return [sentence] if sentence else []
 
 def describe_image():
     """
     图片理解：请求模型描述屏幕上的内容。
     """
+    import pyautogui        # 无显示环境（如压测）下导入即报错，用到时再导入
     # 截屏并保存到上级目录 temp.png 文件
     screen_image = pyautogui.screenshot()
     screen_image.save('../temp.png')
 
-    # 初始化客户端，获取 Base URL 和 API_Key
-    client = OpenAI(
-        base_url=f"{BASE}",
-        api_key=f"{API_KEY}",
-    )
-
     # 定义方法将指定路径图片转为 Base64 编码
     def encode_image(image_path):
         with open(image_path, "rb") as image_file:
@@ -85,8 +180,8 @@ def describe_image():
     # 将图片转为 Base64 编码
     base64_image = encode_image(image_path)
 
-    response = client.chat.completions.create(
-        model=f"{MODEL_NAME}",
+    response = router.call("vision", lambda client, model: client.chat.completions.create(
+        model=model,
         messages=[
             {
                 "role": "system",
@@ -120,7 +215,7 @@ def describe_image():
                 # "type": "auto", # 模型自行判断是否使用深度思考能力
             }
         },
-    )
+    ))
 
     return response.choices[0].message.content
 
@@ -128,20 +223,14 @@ def describe_image():
 def think_image(description, message_history):
     """
     决定“屏幕描述”是否值得告诉桌宠，避免刷屏。
-    返回 {"des": null | "具体变化描述"}。
+    返回 ({"des": null | "具体变化描述"}, message_history)。
     """
-    # 初始化客户端，获取 Base URL 和 API_Key
-    client = OpenAI(
-        base_url=f"{BASE}",
-        api_key=f"{API_KEY}",
-    )
-
     class Judge(BaseModel):
-        des: str
+        des: Optional[str]
 
     message_history.append({"role": "user", "content": description})
-    response = client.beta.chat.completions.parse(
-        model=f"{MODEL_NAME}",
+    response = router.call("judge", lambda client, model: client.beta.chat.completions.parse(
+        model=model,
         messages=message_history,
         response_format=Judge,
         extra_body={
@@ -149,27 +238,30 @@ def think_image(description, message_history):
                 "type": "enabled",  # 使用深度思考能力
             }
         },
-    )
+    ))
     resp = response.choices[0].message.parsed
     message_history.append({"role": "assistant", "content": resp.model_dump_json(indent=2)})
-    return resp.model_dump_json(indent=2)
+    return resp.model_dump(), message_history
+
+# 中译日的用词要求，翻译助手与合并请求共用
+TRANSLATE_RULES = "要求：要将中文的“本座”翻译为“吾輩（わがはい）”；将“主人”翻译为“ご主人（ごしゅじん）”；将“丛雨”翻译为“ムラサメ”；“小雨”则是丛雨的昵称，翻译为“ムラサメちゃん”。且日文要有强烈的古日语风格。"
+
+TRANSLATE_PROMPT = f"你是一个翻译助手，负责将用户输入的中文翻译成日文。{TRANSLATE_RULES}你只需要返回翻译即可，不需要对其中的日文汉字进行注音。"
 
 def get_translate(sentence: str):
     """
-    中译日函数。
+    中译日函数。相同句子的翻译取自缓存
     """
-    # 初始化客户端，获取 Base URL 和 API_Key
-    client = OpenAI(
-        base_url=f"{BASE}",
-        api_key=f"{API_KEY}",
-    )
+    cached = memo_cache.lookup("translate", TRANSLATE_PROMPT, sentence)
+    if cached is not None:
+        return cached
 
-    response = client.chat.completions.create(
-        model=f"{MODEL_NAME}",
+    response = router.call("translate", lambda client, model: client.chat.completions.create(
+        model=model,
         messages=[
             {"role": "system","content": [
                 {"type": "text",
-                 "text": "你是一个翻译助手，负责将用户输入的中文翻译成日文。要求：要将中文的“本座”翻译为“吾輩（わがはい）”；将“主人”翻译为“ご主人（ごしゅじん）”；将“丛雨”翻译为“ムラサメ”；“小雨”则是丛雨的昵称，翻译为“ムラサメちゃん”。且日文要有强烈的古日语风格。你只需要返回翻译即可，不需要对其中的日文汉字进行注音。",
+                 "text": TRANSLATE_PROMPT,
                 }]},
             {"role": "user","content": [{"type": "text","text": f"{sentence}"}]}
         ],
@@ -180,30 +272,38 @@ def get_translate(sentence: str):
                 # "type": "auto", # 模型自行判断是否使用深度思考能力
             }
         },
-    )
+    ))
 
-    return response.choices[0].message.content
+    translated = response.choices[0].message.content
+    memo_cache.store("translate", TRANSLATE_PROMPT, sentence, translated)
+    return translated
+
+EMOTIONS = ("害羞", "平静", "惊讶", "生气", "着急", "高兴")
+EMOTION_PROMPT = "你是一个情感分析助手，负责分析“丛雨”说的话的情感。你现在需要将用户输入的句子进行分析，综合用户的输入和丛雨的输出返回一个丛雨情感的标签。所有供你参考的标签有“害羞”、“平静”、“惊讶”、“生气”、“着急”、“高兴”。你需要直接返回情感标签，不需要其他任何内容。"
 
-def get_emotion(sentence: str):
+# 情感分析记录只保留最近的多少条消息（每次分析 2 条）；记录不发给模型，只需限制长度
+EMOTION_RECORD = 40
+
+def get_emotion(sentence: str, history: list[dict] = []):
     """
     桌宠情感分析函数。
-    输入：用户的输入和丛雨的输出；输出：情感标签。
+    输入：用户的输入和丛雨的输出；输出：(情感标签, history)。
+    history 记录历次分析的输入与标签（不含系统提示）；相同输入的标签取自缓存
     """
-    # 初始化客户端，获取 Base URL 和 API_Key
-    client = OpenAI(
-        base_url=f"{BASE}",
-        api_key=f"{API_KEY}",
-    )
+    emotion = memo_cache.lookup("emotion", EMOTION_PROMPT, sentence)
+    if emotion is not None:
+        record = [{"role": "user", "content": sentence}, {"role": "assistant", "content": emotion}]
+        return emotion, (history + record)[-EMOTION_RECORD:]
 
-    response = client.chat.completions.create(
-        model=f"{MODEL_NAME}",
+    response = router.call("emotion", lambda client, model: client.chat.completions.create(
+        model=model,
         messages=[
             {
                 "role": "system",
                 "content": [
                     {
                         "type": "text",
-                        "text": "你是一个情感分析助手，负责分析“丛雨”说的话的情感。你现在需要将用户输入的句子进行分析，综合用户的输入和丛雨的输出返回一个丛雨情感的标签。所有供你参考的标签有“害羞”、“平静”、“惊讶”、“生气”、“着急”、“高兴”。你需要直接返回情感标签，不需要其他任何内容。",
+                        "text": EMOTION_PROMPT,
                     },
                 ],
             },
@@ -224,89 +324,258 @@ def get_emotion(sentence: str):
                 # "type": "auto", # 模型自行判断是否使用深度思考能力
             }
         },
-    )
+    ))
 
-    if response.choices[0].message.content not in "害羞" "平静" "惊讶" "生气" "着急" "高兴":
+    emotion = response.choices[0].message.content.strip()
+    if emotion not in EMOTIONS:
         print(f"AI返回的情感无法匹配到有效标签。内容如下：")
-        print(f"{response.choices[0].message.content}")
+        print(f"{emotion}")
         emotion = "平静"
-    return emotion
+    else:
+        memo_cache.store("emotion", EMOTION_PROMPT, sentence, emotion)
+    history = history + [{"role": "user", "content": sentence}, {"role": "assistant", "content": emotion}]
+    return emotion, history[-EMOTION_RECORD:]
 
 # -------------- 立绘图层 ------------------
 def get_embedings_layers(response: str, type: str, history: list[dict] = []):
     """
     根据台词情感，返回要叠加的立绘图层 ID 列表
     type='a'/'b' 对应两套 PSD 资源
-    返回如 [1717, 1475, 1261]
+    返回如 [1717, 1475, 1261]；相同台词的合法结果取自缓存
     """
 
-    # 两套提示词，对应两套图层库
-    if type == 'a':
-        sysprompt = '''你是一个立绘图层生成助手。用户会提供一个句子，你需要根据句子的情感来生成一张说话人的立绘所需的图层列表。你需要根据句子的感情来选择图层，供你参考的图层有：
-基础人物 >> 1957：睡衣，双手插在腰间；1956：睡衣，两手自然下垂；1979：便衣1，双手插在腰间；1978：便衣1，两手自然下垂；1953：校服，双手插在腰间；1952：校服，两手自然下垂；1951：便衣2，双手插在腰间；1950：便衣2，两手自然下垂；
-表情 >> 1996：惊奇，闭着嘴（泪）；1995：伤心，眼睛看向镜头（泪）；1994：伤心，眼睛看向别处（泪）；1993：叹气（泪）；1992：欣慰（泪）；1991：高兴（泪）；2009：高兴，闭眼（泪）；1989：失望，闭眼（泪）；1988：叹气，眼睛看向别处（泪）；1987：害羞，腼腆（泪）；1986：惊奇，张着嘴（泪）；1976：困惑，真挚；1975：疑惑，愣住；1974：愣住，焦急，真挚；1973：愤怒，困惑；1972：困惑，羞涩；1971：寂寞 ，羞涩；1970：真挚，寂寞，思考；1969：困惑，愣住，羞涩；1968：困惑，寂寞，羞涩；1967：困惑；1966：困惑，笑容，羞涩；1965：笑容，困惑；1964：笑容；1963：笑容；1935：紧张；1904：嘿嘿嘿；1880：达观；1856：恐惧；1822：严肃；1801：超级不满；1768：极度不满；1738：孩子气；1714：疑惑；1690：愣住；1668：窃笑2；1644：窃笑；1620：愤怒；1596：困惑；1572：思考；1548：真挚；1528：寂寞；1504：羞涩2；1480：羞涩；1455：腼腆；1430：焦急2；1399：焦急；1368：惊讶；1337：愣住；1316：笑容1；1292：平静
-额外装饰 >> 1940：叹气的装饰；1958：腮红（有些害羞）
-头发 >> 1273：穿便衣2时必选的图层；1959：穿除便衣2时必选的图层
-
-以上是你可以选择的图层，基础人物、表情、头发中必须各选一个，额外装饰可以多选，也可以都不选。但是你返回的图层顺序必须是基础人物在最前，之后是表情，之后是额外装饰，最后是头发。
-返回请给出一个JSON列表，里面放上图层ID，例如"[1953, 1801, 1959]"。你不需要返回markdown格式的JSON，你也不需要加入```json这样的内容，你只需要返回纯文本即可。'''
-    else:
-        sysprompt = '''你是一个立绘图层生成助手。用户会提供一个句子，你需要根据句子的情感来生成一张说话人的立绘所需的图层列表。你需要根据句子的感情来选择图层，供你参考的图层有：
-基础人物 >> 1718：睡衣；1717：便衣；1716：校服；1715：便衣2
-表情 >> 1755：伤心（泪）；1754：有些生气，指责（泪）；1753：闭眼（泪）；1752：害羞（泪）；1751：失落（泪）；1750：欣慰，高兴（泪）；1749：高兴（泪）；1748：欣慰，高兴，闭眼（泪）；1747：惊奇（泪）；1787：大哭；1765：大哭2；1745：高兴2（泪）；1733：悲伤，害羞；1732：撒娇，愤怒尖叫，眯眼；1731：愤怒尖叫，认真，惊讶；1730：愤怒尖叫，悲伤，认真；1729：悲伤，撒娇，抬眼；1728：悲伤，害羞，认真；1727：惊讶，基础，抬眼；1726：悲伤；1725：悲伤，笑脸2，微笑；1724：笑脸2，眯眼；1723：悲伤；1722：笑脸2，微笑；1721：笑脸2；1704：达观；1681：认真脸2；1710：超级生气；1641：愤怒尖叫；1616：抬眼，害羞；1712：不满，哼哼唧唧2；1711：不满，哼哼唧唧；1524：认真；1505：瞪大眼睛，惊讶；1475：撒娇；1452：眯眼；1429：悲伤；1406：害羞；1376：惊讶；1352：微笑；1329：笑脸2；1306：平静
-额外装饰 >> 1708：不满时脸色阴沉的装饰；1719：腮红（有些害羞）
-头发 >> 1261：头发（必选）
+    # 图层说明取自图层清单，两套资源共用同一模板
+    manifest = get_manifest(f"ムラサメ{type}")
+    example = ", ".join(str(i) for i in LAYER_EXAMPLES[manifest.target])
+    sysprompt = f'''你是一个立绘图层生成助手。用户会提供一个句子，你需要根据句子的情感来生成一张说话人的立绘所需的图层列表。你需要根据句子的感情来选择图层，供你参考的图层有：
+{manifest.layer_prompt()}
 
 以上是你可以选择的图层，基础人物、表情、头发中必须各选一个，额外装饰可以多选，也可以都不选。但是你返回的图层顺序必须是基础人物在最前，之后是表情，之后是额外装饰，最后是头发。
-返回请给出一个JSON列表，里面放上图层ID，例如"[1718, 1475, 1261]"。你不需要返回markdown格式的JSON，你也不需要加入```json这样的内容，你只需要返回纯文本即可。'''
+返回请给出一个JSON列表，里面放上图层ID，例如"[{example}]"。你不需要返回markdown格式的JSON，你也不需要加入```json这样的内容，你只需要返回纯文本即可。'''
     if history == []:
         history = [{"role": "system", "content": sysprompt}]
     if history[0]["role"] != "system":
         history = [{"role": "system", "content": sysprompt}] + history
-    embeddings_layers, history = query(prompt=response+"/no_think", history=history,
-                                       url=qwen3_endpoint)
+    history.append({"role": "user", "content": response})
+    cached = memo_cache.lookup("layers", sysprompt, response)
+    if cached is not None:
+        history.append({"role": "assistant", "content": cached})
+        return cached, history
+
+    completion = router.call("layers", lambda client, model: client.chat.completions.create(
+        model=model,
+        messages=history,
+        extra_body={
+            "thinking": {
+                "type": "disabled",  # 不使用深度思考能力
+            }
+        },
+    ))
+    embeddings_layers = completion.choices[0].message.content
+    history.append({"role": "assistant", "content": embeddings_layers})
     embeddings_layers = embeddings_layers.split("</think>")[-1].strip()
+    try:
+        manifest.validate(json.loads(embeddings_layers))
+        memo_cache.store("layers", sysprompt, response, embeddings_layers)
+    except (ValueError, TypeError):
+        pass        # 不合规的结果不缓存，交由调用方处理
     return embeddings_layers, history
 
+# -------------- 合并请求 ------------------
+class FusedReply(BaseModel):
+    reply: str                      # 中文回复
+    translation: str                # 日文翻译
+    emotion: Literal[EMOTIONS]      # 情感标签
+    layers: list[int]               # 立绘图层 ID
+
+def fused_query(prompt: str, history: list, role: str = "user", target: str = "ムラサメb"):
+    """
+    一次结构化输出请求同时取回回复、翻译、情感与立绘图层，代替 query + 翻译 + 情感 + 图层四次请求
+    成功返回 (FusedReply, history)，history 与 query 一样只追加输入与中文回复
+    输出不合规（结构不符、图层组合非法等）时返回 None 且不改动 history，调用方应回退到逐项请求
+    """
+    manifest = get_manifest(target)
+    example = ", ".join(str(i) for i in LAYER_EXAMPLES[manifest.target])
+    labels = "、".join(f"“{label}”" for label in EMOTIONS)
+    instruction = f'''请以丛雨的身份回复下一条消息，并按 JSON 格式同时给出以下字段：
+reply：丛雨的中文回复，遵守上面的人设。
+translation：reply 的日文翻译。{TRANSLATE_RULES}不需要对日文汉字进行注音。
+emotion：丛雨说这句话时的情感，只能是 {labels} 之一。
+layers：与 reply 情感相符的立绘图层 ID 列表。基础人物、表情、头发中必须各选一个，额外装饰可以多选，也可以都不选；顺序必须是基础人物、表情、额外装饰、头发，例如 [{example}]。供你参考的图层有：
+{manifest.layer_prompt()}'''
+
+    messages = history + [{"role": "system", "content": instruction}, {"role": role, "content": prompt}]
+    try:
+        response = router.call("fused", lambda client, model: client.beta.chat.completions.parse(
+            model=model,
+            messages=messages,
+            response_format=FusedReply,
+            extra_body={
+                "thinking": {
+                    "type": "enabled",  # 与 query 保持一致
+                }
+            },
+        ))
+        fused = response.choices[0].message.parsed
+        if fused is None:
+            raise ValueError(response.choices[0].message.refusal or "模型未返回结构化结果")
+        fused.layers = list(manifest.validate(fused.layers))
+    except (ValidationError, ValueError, LengthFinishReasonError, ContentFilterFinishReasonError) as e:
+        log(f"合并请求的结果不合规，改为逐项请求：{e}", "warning")
+        return None
+    history.append({"role": role, "content": prompt})
+    history.append({"role": "assistant", "content": fused.reply})
+    return fused, history
+
 # -------------- 语音合成 ------------------
-def generate_tts(sentence: str, emotion):
+def tts_params(sentence: str, emotion, streaming: bool = False) -> tuple:
     """
-    调用本地 SoVITS 服务，生成日语语音
-    sentence: 日语文本
-    emotion: 情感文件夹名，里面需有参考音频与 asr.txt
-    返回: 语音文件 md5（不含扩展名）
-    """
-    # 找参考音频
-    audio = os.listdir(f"../models/Murasame_SoVITS/reference_voices/{emotion}")
-    audio.remove("asr.txt")
-    with open(f"../models/Murasame_SoVITS/reference_voices/{emotion}/asr.txt", "r", encoding="utf-8") as f:
-        ref = f.read().strip()
+    SoVITS 请求参数与参考音频标识（参考音频或其文本变化后，同一句子的语音需要重新合成）
+    """
+    voice = reference_voices.get(emotion)
     params = {
         "text": sentence,
         "text_lang": "ja",
-        "ref_audio_path": os.path.abspath(
-            f"../models/Murasame_SoVITS/reference_voices/{emotion}/{audio[0]}"),
-        "aux_ref_audio_paths": [],
-        "prompt_text": ref,
+        "ref_audio_path": voice.audio,
+        "aux_ref_audio_paths": list(voice.aux),
+        "prompt_text": voice.text,
         "prompt_lang": "ja",
         "top_k": 15,
         "top_p": 1,
         "temperature": 1,
         "text_split_method": "cut1",
+        # 流式合成按分段逐段返回，batch_size 大于 1 会等一批分段都合成完才返回第一段
         "batch_size": 1,
         "batch_threshold": 0.75,
         "split_bucket": True,
         "speed_factor": 1.0,
-        "streaming_mode": False,
+        "streaming_mode": streaming,
         "seed": -1,
         "parallel_infer": True,
         "repetition_penalty": 1.35,
         "sample_steps": 32,
         "super_sampling": False,
     }
-    response = requests.post(
-        pet_sovits_endpoint, json=params)
-    sentence_md5 = hashlib.md5(sentence.encode()).hexdigest()
-    with open(f"./voices/{sentence_md5}.wav", "wb") as f:
-        f.write(response.content)
-    return sentence_md5
\ No newline at end of file
+    return params, voice.identity
+
+def _post_tts(params: dict, stream: bool = False):
+    def request(remaining):
+        connect_timeout, timeout = registry.sovits_timeout()
+        response = registry.sovits().post(current_config().endpoints.sovits_base_url, json=params, stream=stream,
+                                          timeout=(min(remaining, connect_timeout), min(remaining, timeout)))
+        response.raise_for_status()     # 出错时返回的是 JSON 说明，不能当作 wav 写入
+        return response
+
+    return calls.execute("tts", request, retry_on=(requests.ConnectionError, requests.Timeout))
+
+def generate_tts(sentence: str, emotion):
+    """
+    调用本地 SoVITS 服务，生成日语语音
+    sentence: 日语文本
+    emotion: 情感标签，对应 reference_voices 中登记的参考音频
+    返回: 语音文件路径；相同句子、情感与参考音频的语音直接取自缓存
+    """
+    params, reference = tts_params(sentence, emotion)
+    return voice_cache.fetch(sentence, emotion, reference, lambda: _post_tts(params).content)
+
+# 预热用的短句
+WARMUP_TEXT = "はい。"
+
+def warm_up_tts():
+    """
+    为每种情感合成一句短语音（不写入缓存），让 SoVITS 提前载入各参考音频、完成首次推理
+    第一句真正的回复就不必承担冷启动的耗时；SoVITS 未启动时放弃
+    """
+    for emotion in reference_voices.emotions():
+        t_start = time.perf_counter()
+        try:
+            params, _ = tts_params(WARMUP_TEXT, emotion)
+            _post_tts(params)
+        except KeyError as e:
+            # 扫描后参考音频被删除：跳过这种情感
+            log(f"SoVITS 预热（{emotion}）跳过：{e}", "warning")
+            continue
+        except (requests.RequestException, calls.DeadlineExceeded, calls.Cancelled) as e:
+            log(f"SoVITS 预热失败，跳过：{e}", "warning")
+            return
+        log(f"SoVITS 预热（{emotion}）：{time.perf_counter() - t_start:.2f} 秒", "info")
+
+def stream_tts(sentence: str, emotion):
+    """
+    流式语音合成：逐块 yield wav 数据，第一块以文件头开始，之后是 PCM
+    缓存命中或同一句正在合成时，一次给出整个文件；合成完整后写入语音缓存
+    """
+    params, reference = tts_params(sentence, emotion, streaming=True)
+    key = voice_key(sentence, emotion, reference)
+    path, future = voice_cache.acquire(key)
+    if path is not None:
+        with open(path, "rb") as f:
+            yield f.read()
+        return
+
+    # 本请求负责合成：同一句的其他请求等待它完成后直接取用文件
+    try:
+        path = yield from _stream_synthesis(key, sentence, emotion, reference, params)
+    except BaseException as e:
+        # 被打断或播放方不再读取：等待的请求自己重新合成
+        error = calls.Cancelled() if isinstance(e, (calls.Cancelled, GeneratorExit)) else e
+        voice_cache.release(key, future, error=error)
+        raise
+    voice_cache.release(key, future, path=path)
+
+def _stream_synthesis(key: str, sentence: str, emotion, reference: str, params: dict):
+    # 期限只约束到收到响应头为止，之后的音频随到随播
+    response = _post_tts(params, stream=True)
+    received = bytearray()
+    try:
+        # 中断时从另一线程关闭响应，正在等待的读取立即结束
+        with calls.on_cancel(response.close):
+            for chunk in response.iter_content(chunk_size=4096):
+                received += chunk
+                yield chunk
+    except Exception:
+        if calls.cancelled():
+            raise calls.Cancelled() from None
+        raise
+    finally:
+        response.close()
+    calls.check_cancelled()
+    if not current_config().voices.cache:
+        return None     # 音频已在内存中播放，不复用时无需落盘
+    return voice_cache.store(key, sentence, emotion, reference, complete_wav(bytes(received)))
+
+@dataclass(frozen=True)
+class Voice:
+    """
+    一次语音合成的结果
+    """
+    path: str           # wav 文件路径
+    seconds: float      # 合成耗时（秒），取自缓存时接近 0
+
+    def data(self) -> bytes:
+        with open(self.path, "rb") as f:
+            return f.read()
+
+# 语音合成任务在这里执行，线程数取自 voices.workers，首次合成时创建
+_tts_executor = None
+_tts_executor_lock = threading.Lock()
+
+def synthesize(sentence: str, emotion) -> Future:
+    """
+    提交语音合成任务，立即返回 Future[Voice]；失败时 result() 抛出对应异常
+    任务继承调用方的 cancel_scope，中断后放弃
+    """
+    def run():
+        t_start = time.perf_counter()
+        path = generate_tts(sentence, emotion)
+        return Voice(path, time.perf_counter() - t_start)
+
+    return calls.submit(tts_executor(), run)
+
+def tts_executor() -> ThreadPoolExecutor:
+    global _tts_executor
+    with _tts_executor_lock:
+        if _tts_executor is None:
+            _tts_executor = ThreadPoolExecutor(max_workers=current_config().voices.workers,
+                                               thread_name_prefix="tts")
+        return _tts_executor
@@ -0,0 +1,143 @@
+# ==========================================
+# clients.py – API 客户端注册表
+# 云端 / 本地 OpenAI 兼容接口与 SoVITS 各持有一个长连接池，全进程共用
+# 统计每个连接池的请求数与新建连接数，用于确认连接复用
+# ==========================================
+
+import threading
+import httpx
+import requests
+from openai import OpenAI, DefaultHttpxClient
+from requests.adapters import HTTPAdapter
+from . import config
+from .utils import log
+
+# endpoints 中各客户端对应的字段
+ENDPOINTS = {
+    "cloud": ("base_url", "api_key"),
+    "local": ("local_base_url", "local_api_key"),
+}
+
+class _CountingTransport(httpx.HTTPTransport):
+    """
+    统计请求数与实际新建的 TCP 连接数（通过 httpcore 的 trace 事件）
+    """
+
+    def __init__(self, stats: dict, lock: threading.Lock, **kwargs):
+        super().__init__(**kwargs)
+        self._stats = stats
+        self._lock = lock
+
+    def handle_request(self, request):
+        outer_trace = request.extensions.get("trace")
+
+        def trace(event_name, info):
+            if event_name == "connection.connect_tcp.complete":
+                with self._lock:
+                    self._stats["connections"] += 1
+            if outer_trace is not None:
+                outer_trace(event_name, info)
+
+        request.extensions["trace"] = trace
+        with self._lock:
+            self._stats["requests"] += 1
+        return super().handle_request(request)
+
+class ClientRegistry:
+    """
+    客户端注册表：按名字懒加载并缓存客户端
+    openai("cloud") / openai("local")：OpenAI 兼容接口
+    sovits()：访问 GPT-SoVITS 的 requests.Session
+    endpoints 或 network 配置变化后丢弃旧客户端，下次取用时按新配置重建
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._openai = {}       # name → OpenAI
+        self._stats = {}        # name → {"requests", "connections"}
+        self._sovits = None
+        config.on_change(self._on_config_change)
+
+    def network(self) -> config.NetworkConfig:
+        return config.current().network
+
+    def openai(self, name: str = "cloud") -> OpenAI:
+        with self._lock:
+            client = self._openai.get(name)
+            if client is None:
+                client = self._openai[name] = self._create_openai(name)
+            return client
+
+    def sovits(self) -> requests.Session:
+        with self._lock:
+            if self._sovits is None:
+                pool_size = self.network().pool_size
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._sovits = session
+            return self._sovits
+
+    def sovits_timeout(self) -> tuple:
+        """
+        requests 的 (连接超时, 读取超时)
+        """
+        network = self.network()
+        return network.connect_timeout, network.timeout
+
+    def stats(self) -> dict:
+        """
+        各连接池的请求数、新建连接数与复用次数
+        """
+        with self._lock:
+            result = {name: {**stats, "reused": stats["requests"] - stats["connections"]}
+                      for name, stats in self._stats.items()}
+            if self._sovits is not None:
+                requests_count = connections = 0
+                poolmanager = self._sovits.get_adapter("http://").poolmanager
+                for key in poolmanager.pools.keys():
+                    pool = poolmanager.pools[key]
+                    requests_count += pool.num_requests
+                    connections += pool.num_connections
+                result["sovits"] = {"requests": requests_count, "connections": connections,
+                                    "reused": requests_count - connections}
+            return result
+
+    def close(self):
+        with self._lock:
+            for client in self._openai.values():
+                client.close()
+            self._openai.clear()
+            if self._sovits is not None:
+                self._sovits.close()
+                self._sovits = None
+
+    def _on_config_change(self, old: config.Config, new: config.Config):
+        if old.endpoints == new.endpoints and old.network == new.network:
+            return
+        # 只丢弃引用、不主动关闭：其他线程可能仍在用旧客户端完成请求，由垃圾回收关闭
+        with self._lock:
+            self._openai.clear()
+            self._sovits = None
+        log("接口配置已变化，客户端将按新配置重建", "info")
+
+    def _create_openai(self, name: str) -> OpenAI:
+        url_key, api_key_key = ENDPOINTS[name]
+        endpoints = config.current().endpoints
+        network = self.network()
+        stats = self._stats.setdefault(name, {"requests": 0, "connections": 0})
+        limits = httpx.Limits(max_connections=network.pool_size,
+                              max_keepalive_connections=network.pool_size)
+        http_client = DefaultHttpxClient(
+            transport=_CountingTransport(stats, threading.Lock(), limits=limits),
+            timeout=httpx.Timeout(network.timeout, connect=network.connect_timeout),
+        )
+        return OpenAI(
+            base_url=getattr(endpoints, url_key),
+            api_key=getattr(endpoints, api_key_key),
+            http_client=http_client,
+            max_retries=0,      # 重试由 calls.execute 统一负责（带期限与中断）
+        )
+
+registry = ClientRegistry()
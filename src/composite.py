@@ -0,0 +1,34 @@
+# ==========================================
+# composite.py – 图层混合内核
+# 定点整数（uint16）一次性混合 BGRA 四个通道，原地写回画布
+# ==========================================
+
+import numpy as np
+
+def blend_over(dst, src):
+    """
+    把 src 以 "over" 方式叠加到 dst 上（原地修改 dst）
+    dst: uint8 BGRA 画布区域（可以是切片视图），形状与 src 相同
+    src: uint8 BGRA 图层
+    颜色：src * a + dst * (1 - a)；src 为未预乘的图层，dst 从全透明开始叠加，结果即预乘颜色
+    透明度：a + dst_a * (1 - a)
+    """
+    alpha = src[..., 3:].astype(np.uint16)      # 0~255，定点表示的 a
+
+    # 累加器的量级为 255²，最大 65025，uint16 放得下
+    acc = src.astype(np.uint16)
+    acc *= alpha
+    acc[..., 3] = alpha[..., 0] * 255
+
+    np.subtract(255, alpha, out=alpha)          # alpha 就地变为 1 - a
+    tmp = dst.astype(np.uint16)
+    tmp *= alpha
+    acc += tmp
+
+    # 除以 255 并四舍五入：(x + 128 + ((x + 128) >> 8)) >> 8，全程不超过 65535
+    acc += 128
+    np.right_shift(acc, 8, out=tmp)
+    acc += tmp
+    acc >>= 8
+    np.copyto(dst, acc, casting='unsafe')
+    return dst
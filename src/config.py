@@ -0,0 +1,288 @@
+# ==========================================
+# config.py – 配置模块
+# 读取并校验项目根目录的 config.json，生成不可变的配置快照
+# 后台线程监视文件变化，校验通过后原子替换快照并通知订阅者
+# ==========================================
+
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field, fields
+from types import MappingProxyType
+from .utils import log
+
+CONFIG_PATH = "../config.json"
+
+@dataclass(frozen=True)
+class Endpoints:
+    base_url: str
+    api_key: str
+    model_id: str
+    local_base_url: str
+    local_api_key: str
+    local_model_id: str
+    sovits_base_url: str
+
+@dataclass(frozen=True)
+class NetworkConfig:
+    pool_size: int = 8              # 每个接口的最大连接数
+    timeout: float = 120            # 读取超时（秒），深度思考可能较慢
+    connect_timeout: float = 10     # 建立连接超时（秒）
+
+@dataclass(frozen=True)
+class RenderConfig:
+    scale: float = 0.5
+    layer_cache_mb: int = 256
+    sprite_cache_entries: int = 8
+    sprite_disk_cache: bool = True
+
+@dataclass(frozen=True)
+class MemoConfig:
+    enabled: bool = True
+    ttl_days: float = 30            # 缓存有效期（天）
+    max_entries: int = 5000         # 条目上限，超出后淘汰最久未使用的
+
+@dataclass(frozen=True)
+class HistoryConfig:
+    max_tokens: int = 8000          # 对话历史的 token 预算
+    summarize_at: float = 0.75      # 达到预算的该比例时开始后台总结
+    model_budgets: dict = field(default_factory=lambda: MappingProxyType({}))      # 模型 ID → 单独的 token 预算
+
+@dataclass(frozen=True)
+class RoutingConfig:
+    default: str = "cloud"          # 未在 policy 中列出的调用类型使用的接口
+    policy: dict = field(default_factory=lambda: MappingProxyType({}))      # 调用类型 → "cloud" / "local"
+    failover: bool = True           # 首选接口出错时改用另一个
+    hedge: list = ("translate", "emotion", "layers")    # 启用对冲请求的调用类型
+    cooldown: float = 30            # 连续失败后暂停使用该接口的时间（秒）
+
+@dataclass(frozen=True)
+class CallsConfig:
+    deadlines: dict = field(default_factory=lambda: MappingProxyType({}))   # 调用类型 → 总期限（秒），覆盖 calls.DEADLINES
+    retries: int = 2                # 连不上、超时等错误的最多重试次数
+    backoff: float = 0.5            # 退避基数（秒），第 n 次重试前随机等待 0 ~ backoff × 2ⁿ
+    workers: int = 32               # 执行模型与语音请求的线程数（修改后需重启）
+
+@dataclass(frozen=True)
+class VoiceConfig:
+    cache: bool = True              # 相同句子、情感与参考音频的语音直接复用
+    max_mb: int = 512               # 语音缓存目录的容量上限（MB），超出后淘汰最久未播放的
+    workers: int = 2                # 同时进行的语音合成请求数（修改后需重启）
+    streaming: bool = False         # 流式合成：收到第一段音频即开始播放（需 SoVITS api_v2）
+    warmup: bool = True             # 启动时为每种情感预先合成一句，避免首次合成的冷启动
+
+@dataclass(frozen=True)
+class ReactionConfig:
+    enabled: bool = True            # 摸头、启动问候等事件使用预生成的回复
+    pool_size: int = 3              # 每个事件预生成的回复数
+    idle_seconds: float = 30        # 距上次活动超过该时间（秒）才在后台生成
+
+@dataclass(frozen=True)
+class Config:
+    endpoints: Endpoints
+    enable_vl: bool = False
+    streaming: bool = True          # 流式回复：边生成边显示、边翻译合成语音
+    fused: bool = False             # 合并请求：一次结构化输出取回回复、翻译、情感与图层
+    screen_interval: float = 30     # 后台截屏间隔（秒）
+    network: NetworkConfig = field(default_factory=NetworkConfig)
+    render: RenderConfig = field(default_factory=RenderConfig)
+    memo: MemoConfig = field(default_factory=MemoConfig)
+    history: HistoryConfig = field(default_factory=HistoryConfig)
+    routing: RoutingConfig = field(default_factory=RoutingConfig)
+    calls: CallsConfig = field(default_factory=CallsConfig)
+    voices: VoiceConfig = field(default_factory=VoiceConfig)
+    reactions: ReactionConfig = field(default_factory=ReactionConfig)
+    raw: MappingProxyType = field(default_factory=lambda: MappingProxyType({}), compare=False)
+
+# -------------- 解析与校验 ------------------
+def _check(value, expected, name: str):
+    # bool 是 int 的子类，数值字段不接受 true/false
+    if isinstance(value, bool) and bool not in expected:
+        raise ValueError(f"config.json 中 {name} 的类型应为 {expected[0].__name__}")
+    if not isinstance(value, expected):
+        raise ValueError(f"config.json 中 {name} 的类型应为 {expected[0].__name__}")
+    return value
+
+_TYPES = {str: (str,), int: (int,), float: (float, int), bool: (bool,), dict: (dict,), list: (list,)}
+
+# 数值字段的取值范围：字段 → (判断, 说明)；类型正确但取值无意义的配置同样拒绝
+_RANGES = {
+    "network.pool_size": (lambda v: v >= 1, "不小于 1"),
+    "network.timeout": (lambda v: v > 0, "大于 0"),
+    "network.connect_timeout": (lambda v: v > 0, "大于 0"),
+    "render.scale": (lambda v: 0 < v <= 1, "在 (0, 1] 之间"),
+    "render.layer_cache_mb": (lambda v: v >= 1, "不小于 1"),
+    "render.sprite_cache_entries": (lambda v: v >= 1, "不小于 1"),
+    "memo.ttl_days": (lambda v: v > 0, "大于 0"),
+    "memo.max_entries": (lambda v: v >= 1, "不小于 1"),
+    "history.max_tokens": (lambda v: v >= 1, "不小于 1"),
+    "history.summarize_at": (lambda v: 0 < v <= 1, "在 (0, 1] 之间"),
+    "routing.cooldown": (lambda v: v >= 0, "不小于 0"),
+    "calls.retries": (lambda v: v >= 0, "不小于 0"),
+    "calls.backoff": (lambda v: v >= 0, "不小于 0"),
+    "calls.workers": (lambda v: v >= 1, "不小于 1"),
+    "voices.max_mb": (lambda v: v >= 1, "不小于 1"),
+    "voices.workers": (lambda v: v >= 1, "不小于 1"),
+    "reactions.pool_size": (lambda v: v >= 1, "不小于 1"),
+    "reactions.idle_seconds": (lambda v: v >= 0, "不小于 0"),
+    "screen_interval": (lambda v: v > 0, "大于 0"),
+}
+
+def _check_range(value, name: str):
+    rule = _RANGES.get(name)
+    if rule is not None and not rule[0](value):
+        raise ValueError(f"config.json 中 {name} 应{rule[1]}")
+    return value
+
+def _check_mapping(mapping: dict, expected, name: str, rule):
+    """
+    校验 dict 形式的配置（如模型 ID → 预算）：每个值的类型与取值范围
+    """
+    for key, value in mapping.items():
+        _check(value, expected, f"{name}.{key}")
+        if not rule[0](value):
+            raise ValueError(f"config.json 中 {name}.{key} 应{rule[1]}")
+
+def _freeze(value):
+    """
+    dict / list 字段存为只读的 MappingProxyType / tuple，快照被共享后不会被就地修改
+    """
+    if isinstance(value, dict):
+        return MappingProxyType(dict(value))
+    if isinstance(value, list):
+        return tuple(value)
+    return value
+
+def _section(cls, data, name: str, required: bool = False):
+    """
+    按 dataclass 字段读取并校验一个配置段；缺省字段取默认值
+    """
+    if data is None:
+        if required:
+            raise ValueError(f"config.json 缺少 {name}")
+        return cls()
+    _check(data, (dict,), name)
+    values = {}
+    for f in fields(cls):
+        if f.name not in data:
+            if required:
+                raise ValueError(f"config.json 缺少 {name}.{f.name}")
+            continue
+        values[f.name] = _freeze(_check_range(_check(data[f.name], _TYPES[f.type], f"{name}.{f.name}"),
+                                              f"{name}.{f.name}"))
+    return cls(**values)
+
+def parse_config(raw: dict) -> Config:
+    """
+    dict → Config；字段缺失、类型不符或取值超出范围时抛出 ValueError
+    """
+    _check(raw, (dict,), "根节点")
+    values = {
+        "endpoints": _section(Endpoints, raw.get("endpoints"), "endpoints", required=True),
+        "network": _section(NetworkConfig, raw.get("network"), "network"),
+        "render": _section(RenderConfig, raw.get("render"), "render"),
+        "memo": _section(MemoConfig, raw.get("memo"), "memo"),
+        "history": _section(HistoryConfig, raw.get("history"), "history"),
+        "routing": _section(RoutingConfig, raw.get("routing"), "routing"),
+        "calls": _section(CallsConfig, raw.get("calls"), "calls"),
+        "voices": _section(VoiceConfig, raw.get("voices"), "voices"),
+        "reactions": _section(ReactionConfig, raw.get("reactions"), "reactions"),
+        "raw": MappingProxyType(raw),
+    }
+    routing = values["routing"]
+    for kind, name in {"default": routing.default, **routing.policy}.items():
+        if name not in ("cloud", "local"):
+            raise ValueError(f"config.json 中 routing 的 {kind} 只能是 cloud 或 local")
+    if "stream" in routing.hedge:
+        # 落后的流式请求无法取消计费，也占着连接，不允许对冲
+        raise ValueError("config.json 中 routing.hedge 不能包含 stream")
+    _check_mapping(values["history"].model_budgets, (int,), "history.model_budgets", (lambda v: v >= 1, "不小于 1"))
+    _check_mapping(values["calls"].deadlines, (float, int), "calls.deadlines", (lambda v: v > 0, "大于 0"))
+    if "enable_vl" in raw:
+        values["enable_vl"] = _check(raw["enable_vl"], (bool,), "enable_vl")
+    if "streaming" in raw:
+        values["streaming"] = _check(raw["streaming"], (bool,), "streaming")
+    if "fused" in raw:
+        values["fused"] = _check(raw["fused"], (bool,), "fused")
+    if "screen_interval" in raw:
+        values["screen_interval"] = _check_range(_check(raw["screen_interval"], (float, int), "screen_interval"),
+                                                 "screen_interval")
+    return Config(**values)
+
+def load_config(path: str = CONFIG_PATH) -> Config:
+    with open(path, "r", encoding="utf-8") as f:
+        return parse_config(json.load(f))
+
+# -------------- 快照与热更新 ------------------
+_lock = threading.Lock()
+_snapshot = None        # 当前 Config
+_mtime_ns = None        # 当前快照对应的文件 mtime
+_subscribers = []       # callback(old, new)
+_watcher = None
+
+def current() -> Config:
+    """
+    当前配置快照（只读）；首次调用时读取文件，之后只读内存
+    """
+    global _snapshot, _mtime_ns
+    snapshot = _snapshot
+    if snapshot is not None:
+        return snapshot
+    with _lock:
+        if _snapshot is None:
+            _mtime_ns = os.stat(CONFIG_PATH).st_mtime_ns
+            _snapshot = load_config(CONFIG_PATH)
+        return _snapshot
+
+def on_change(callback):
+    """
+    订阅配置变化：callback(old, new) 在监视线程中调用
+    """
+    _subscribers.append(callback)
+
+def reload() -> bool:
+    """
+    文件有变化时重新读取；校验失败则保留旧快照。返回是否替换了快照
+    """
+    global _snapshot, _mtime_ns
+    try:
+        mtime_ns = os.stat(CONFIG_PATH).st_mtime_ns
+    except OSError:
+        return False
+    with _lock:
+        if mtime_ns == _mtime_ns:
+            return False
+        _mtime_ns = mtime_ns
+        try:
+            new = load_config(CONFIG_PATH)
+        except (OSError, ValueError) as e:
+            log(f"config.json 无效，继续使用旧配置：{e}", "error")
+            return False
+        old, _snapshot = _snapshot, new
+    if old == new:
+        return False
+    log("config.json 已重新加载", "info")
+    for callback in list(_subscribers):
+        try:
+            callback(old, new)
+        except Exception as e:
+            log(f"配置更新回调出错：{e}", "error")
+    return True
+
+def watch(interval: float = 1.0):
+    """
+    启动后台监视线程（守护线程，只启动一次）
+    """
+    global _watcher
+    if _watcher is not None:
+        return
+    current()
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            reload()
+
+    _watcher = threading.Thread(target=loop, name="config-watcher", daemon=True)
+    _watcher.start()
@@ -1,69 +1,304 @@
 # ==========================================
 # generate.py – 立绘合成模块
-# 读取 PSD 导出的 txt 坐标 + PNG 切片，合成最终立绘
+# 读取图层清单（manifest.py）+ PNG 切片，合成最终立绘
+# 缩小显示时直接用预先缩小的图层（cache/mips）在显示尺寸上合成
 # ==========================================
 
-import csv
+import os
+import threading
+from collections import OrderedDict
 import cv2
 import numpy as np
+from .composite import blend_over
+from .manifest import get_manifest
+from .utils import log
 
-def generate_fgimage(target, embeddings_layers):
+# -------------- 解码图层缓存 ------------------
+class LayerCache:
     """
-    target: "ムラサメa" 或 "ムラサメb"，对应两套资源
-    embeddings_layers: 如 [1717, 1475, 1261]
-    返回: BGRA 的 numpy 画布，可直接被 Qt 显示
+    进程内的已解码图层缓存（BGRA numpy），按字节预算做 LRU 淘汰
+    缓存中的数组只读，调用方不得原地修改
     """
-    assert target in ["ムラサメa", "ムラサメb"]
-    # 读取 PSD 导出信息（utf-16 le 是 PhotoShop 默认）
-    with open(f"../fgimages/{target}.txt", encoding='utf-16 le') as cf:
-        infos = list(csv.reader(cf, delimiter='\t'))    # 每行：图层名/坐标/尺寸/PNG 路径等
 
-    # 根据 target 选基础人物图层区间（用于坐标对齐）
-    if target == "ムラサメa":
-        all_base = infos[57:65]
-    else:
-        all_base = infos[47:51]
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()     # path → ndarray
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, path: str):
+        """
+        返回 path 对应的已解码图层，未命中时解码并放入缓存；解码失败返回 None
+        """
+        with self._lock:
+            image = self._items.get(path)
+            if image is not None:
+                self._items.move_to_end(path)
+                self.hits += 1
+                return image
+            self.misses += 1
 
-    # 收集要叠加的图层坐标
-    all_positions = [(int(x[2]), int(x[3]), int(x[4]), int(x[5]))
-                     for name in embeddings_layers for x in infos if x[9] == str(name)]
+        image = cv2.imdecode(np.fromfile(path, dtype=np.uint8), -1)     # -1 保留 alpha
+        if image is None:
+            return None
+        image.flags.writeable = False
 
-    # 基础人物坐标（用于整体偏移归一化）
-    all_base = [(int(x[2]), int(x[3]), int(x[4]), int(x[5]))
-                for x in all_base]
+        with self._lock:
+            if path not in self._items:
+                self._items[path] = image
+                self._bytes += image.nbytes
+                self._evict()
+        return image
 
-    # 左上角对齐：所有坐标减去最小 x,y
-    all_positions = [(pos[0] - min(pos[0] for pos in all_base), pos[1] - min(pos[1] for pos in all_base), pos[2], pos[3])
-                     for pos in all_positions]
+    def discard(self, path: str):
+        with self._lock:
+            image = self._items.pop(path, None)
+            if image is not None:
+                self._bytes -= image.nbytes
 
-    # 画布大小 = 最大右下坐标
-    canvas_scale = (max([(x[0] + x[2]) for x in all_positions]),
-                    max([(x[1] + x[3]) for x in all_positions]))
+    def set_budget(self, max_bytes: int):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
 
-    # 4 通道全透明
-    canvas = np.zeros((canvas_scale[1], canvas_scale[0], 4), dtype=np.uint8)
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "entries": len(self._items), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+    def _evict(self):
+        # 至少保留最新的一项，避免单个超大图层反复解码
+        while self._bytes > self.max_bytes and len(self._items) > 1:
+            _, image = self._items.popitem(last=False)
+            self._bytes -= image.nbytes
+            self.evictions += 1
+
+# 默认 256 MB，约可容纳全部基础人物 + 常用表情；可在 config.json 的 render.layer_cache_mb 调整
+layer_cache = LayerCache(max_bytes=256 * 1024 * 1024)
+
+def _resolve_layers(manifest, embeddings_layers) -> list:
+    """
+    layer_id 列表 → LayerRecord 列表，跳过清单中不存在的图层（模型偶尔会编造 ID）
+    """
+    unknown = [layer_id for layer_id in embeddings_layers if int(layer_id) not in manifest.layers]
+    if unknown:
+        log(f"{manifest.target} 中不存在图层 {unknown}，已忽略", "warning")
+    return [manifest.layers[int(layer_id)] for layer_id in embeddings_layers
+            if int(layer_id) in manifest.layers]
+
+# -------------- 多级缩放（mip） ------------------
+MIP_DIR = "../cache/mips"
+
+def mip_level(scale: float) -> int:
+    """
+    不小于 scale 的最小 1/2^level，例如 0.5 → 1，0.3 → 1，0.25 → 2
+    """
+    if not scale > 0:
+        raise ValueError(f"缩放比例应大于 0：{scale}")
+    level = 0
+    while scale <= 0.5 / (1 << level):
+        level += 1
+    return level
+
+def _area_resize(image, size):
+    """
+    BGRA 区域平均缩放；先预乘 alpha 再缩放，避免透明边缘发黑/发白
+    """
+    alpha = image[..., 3].astype(np.float32)
+    ones = np.ones_like(alpha)
+    alpha *= 1 / 255.0
+    pixels = cv2.multiply(image.astype(np.float32), cv2.merge([alpha, alpha, alpha, ones]))
+    small = cv2.resize(pixels, size, interpolation=cv2.INTER_AREA)
+
+    alpha = small[..., 3].copy()
+    np.divide(255.0, alpha, out=alpha, where=alpha > 0)
+    small = cv2.multiply(small, cv2.merge([alpha, alpha, alpha, np.ones_like(alpha)]))
+    return cv2.convertScaleAbs(small)       # 四舍五入并截断到 0~255
+
+def _mip_path(manifest, layer, level: int) -> str:
+    """
+    缩小图的文件名带上左上补齐量：补齐量取决于 txt 中的坐标，坐标改了就换一个文件，不会误用旧的缩小图
+    """
+    x, y = manifest.offset(layer.layer_id)
+    factor = 1 << level
+    return f"{MIP_DIR}/{manifest.target}_{layer.layer_id}@{level}+{x % factor},{y % factor}.png"
+
+def _build_mip(manifest, layer, level: int, path: str):
+    """
+    生成第 level 级缩小图层：左上补齐到 2^level 的整数倍后再缩小，保证各图层缩小后仍对齐
+    """
+    image = layer_cache.get(layer.path)
+    if image is None:
+        raise FileNotFoundError(f"图层 PNG 缺失或无法解码：{layer.path}")
+    factor = 1 << level
+    x, y = manifest.offset(layer.layer_id)
+    pad_x, pad_y = x % factor, y % factor
+    h, w = image.shape[:2]
+    padded = np.zeros((-(-(pad_y + h) // factor) * factor, -(-(pad_x + w) // factor) * factor, 4),
+                      dtype=np.uint8)
+    padded[pad_y:pad_y + h, pad_x:pad_x + w] = image
+    small = _area_resize(padded, (padded.shape[1] // factor, padded.shape[0] // factor))
+
+    os.makedirs(MIP_DIR, exist_ok=True)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp.png"
+    cv2.imencode(".png", small)[1].tofile(tmp_path)     # tofile 兼容 Windows 下的日文路径
+    os.replace(tmp_path, path)
+
+def _layer_image(manifest, layer, level: int):
+    """
+    第 level 级的图层像素；缩小图首次使用时生成并缓存到磁盘，原图更新后自动重建
+    """
+    if level == 0:
+        return layer_cache.get(layer.path)
+    path = _mip_path(manifest, layer, level)
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(layer.path):
+        _build_mip(manifest, layer, level, path)
+        layer_cache.discard(path)
+    return layer_cache.get(path)
+
+def _placement(manifest, layer, level: int):
+    """
+    图层在第 level 级画布上的位置：(x, y, 包围盒 (bx, by, bw, bh))，包围盒相对该级图层左上角
+    """
+    x, y = manifest.offset(layer.layer_id)
+    bx, by, bw, bh = layer.bbox
+    if level == 0 or bw == 0 or bh == 0:
+        return x, y, layer.bbox
+    factor = 1 << level
+    pad_x, pad_y = x % factor, y % factor
+    x0, y0 = (bx + pad_x) // factor, (by + pad_y) // factor
+    x1, y1 = -(-(bx + bw + pad_x) // factor), -(-(by + bh + pad_y) // factor)
+    return (x - pad_x) // factor, (y - pad_y) // factor, (x0, y0, x1 - x0, y1 - y0)
+
+def _layer_rect(manifest, layer, level: int, size) -> tuple:
+    """
+    图层不透明包围盒在画布上的矩形 (x0, y0, x1, y1)，已裁剪到画布内
+    """
+    x, y, (bx, by, bw, bh) = _placement(manifest, layer, level)
+    return (max(x + bx, 0), max(y + by, 0),
+            min(x + bx + bw, size[0]), min(y + by + bh, size[1]))
+
+def _blend_layer(canvas, manifest, layer, level: int = 0):
+    """
+    把单个图层叠加到画布上，只混合不透明像素的包围盒
+    """
+    size = (canvas.shape[1], canvas.shape[0])
+    x0, y0, x1, y1 = _layer_rect(manifest, layer, level, size)
+    if x1 <= x0 or y1 <= y0:
+        return
+    image = _layer_image(manifest, layer, level)
+    if image is not None:
+        x, y, _ = _placement(manifest, layer, level)
+        blend_over(canvas[y0:y1, x0:x1], image[y0 - y:y1 - y, x0 - x:x1 - x])
 
+def _canvas_size(manifest, layers, level: int) -> tuple:
+    # 画布大小 = 最大右下坐标（坐标已减去基础人物的最小 x,y），按级别缩小
+    width, height = manifest.canvas_size([layer.layer_id for layer in layers])
+    return width >> level, height >> level
+
+def _composite(manifest, layers, level: int):
+    size = _canvas_size(manifest, layers, level)
+    # 4 通道全透明
+    canvas = np.zeros((size[1], size[0], 4), dtype=np.uint8)
     # 逐层叠加 PNG（带透明通道）
-    for idx, pos in enumerate(all_positions):
-        path = f"../fgimages/{target}_{embeddings_layers[idx]}.png"
-        image = cv2.imdecode(np.fromfile(path, dtype=np.uint8), -1)     # -1 保留 alpha
-        if image is not None:
-            x_offset = pos[0]
-            y_offset = pos[1]
-            h, w = image.shape[:2]
-            alpha_img = image[..., 3:] / 255.0      # 0~1
-            alpha_canvas = 1.0 - alpha_img
-            for c in range(3):      # BGR
-                canvas[y_offset:y_offset + h, x_offset:x_offset + w, c] = (
-                    alpha_img[..., 0] * image[..., c] +
-                    alpha_canvas[..., 0] * canvas[y_offset:y_offset +
-                                                  h, x_offset:x_offset + w, c]
-                )
-
-            # alpha 通道取最大值，避免半透明叠加出错
-            canvas[y_offset:y_offset + h, x_offset:x_offset + w, 3] = (
-                np.maximum(
-                    image[..., 3], canvas[y_offset:y_offset + h, x_offset:x_offset + w, 3])
-            )
-
-    return canvas
\ No newline at end of file
+    for layer in layers:
+        _blend_layer(canvas, manifest, layer, level)
+    return canvas
+
+# -------------- 增量合成 ------------------
+class IncrementalCompositor:
+    """
+    缓存最底层（基础人物）的合成结果；基础人物不变时，
+    只把上一次表情/装饰/头发覆盖的脏矩形恢复为底图，再叠加新的上层图层
+    返回的画布会在下一次调用时被原地修改，调用方需立即使用或自行拷贝
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key = None        # (target, 基础人物 layer_id, 级别)
+        self._base = None       # 只含基础人物的画布
+        self._canvas = None     # 当前完整画布
+        self._dirty = None      # 上一次上层图层覆盖的矩形 (x0, y0, x1, y1)
+        self.full = 0
+        self.incremental = 0
+
+    def compose(self, manifest, layers, level: int = 0):
+        target = manifest.target
+        base, upper = layers[0], layers[1:]
+        size = _canvas_size(manifest, layers, level)
+
+        with self._lock:
+            # 上层图层超出基础人物范围时画布尺寸会变，不走增量
+            if size != _canvas_size(manifest, [base], level):
+                self.full += 1
+                return _composite(manifest, layers, level)
+
+            if self._key != (target, base.layer_id, level):
+                self._base = _composite(manifest, [base], level)
+                self._base.flags.writeable = False
+                self._canvas = self._base.copy()
+                self._key = (target, base.layer_id, level)
+                self._dirty = None
+                self.full += 1
+            else:
+                self.incremental += 1
+
+            # 脏矩形以外的区域与底图一致，只需恢复脏矩形
+            if self._dirty is not None:
+                x0, y0, x1, y1 = self._dirty
+                self._canvas[y0:y1, x0:x1] = self._base[y0:y1, x0:x1]
+
+            rects = [rect for rect in (_layer_rect(manifest, layer, level, size) for layer in upper)
+                     if rect[2] > rect[0] and rect[3] > rect[1]]
+            for layer in upper:
+                _blend_layer(self._canvas, manifest, layer, level)
+            self._dirty = (min(r[0] for r in rects), min(r[1] for r in rects),
+                           max(r[2] for r in rects), max(r[3] for r in rects)) if rects else None
+            return self._canvas
+
+    def reset(self):
+        with self._lock:
+            self._key = self._base = self._canvas = self._dirty = None
+
+compositor = IncrementalCompositor()
+
+def generate_fgimage(target, embeddings_layers, scale=1.0, incremental=False):
+    """
+    target: "ムラサメa" 或 "ムラサメb"，对应两套资源
+    embeddings_layers: 如 [1717, 1475, 1261]
+    scale: 输出缩放；直接用对应级别的缩小图层合成，非 2 的幂时再缩放剩余部分
+    incremental: 复用上一次的基础人物底图，只重绘表情区域；
+                 此时返回的画布可能在下一次增量调用时被原地修改
+    返回: BGRA 的 numpy 画布，颜色已预乘 alpha（在透明画布上逐层 over 叠加的结果）
+    """
+    manifest = get_manifest(target)
+    layers = _resolve_layers(manifest, embeddings_layers)
+    level = mip_level(scale)
+    if incremental:
+        canvas = compositor.compose(manifest, layers, level)
+    else:
+        canvas = _composite(manifest, layers, level)
+
+    if scale == 1.0 / (1 << level):
+        return canvas
+    width, height = manifest.canvas_size([layer.layer_id for layer in layers])
+    # 画布已是预乘颜色，直接区域平均即可（_area_resize 面向未预乘的图层）
+    return cv2.resize(canvas, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+
+if __name__ == "__main__":
+    import sys
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))   # 资源路径均相对 src/
+    if sys.argv[1:2] == ["bake"]:
+        from .bake import main
+        main(sys.argv[2:])
+    else:
+        print("用法：python -m src.generate bake [--target ムラサメb] [--scale 0.5] ...")
+        sys.exit(2)
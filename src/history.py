@@ -0,0 +1,155 @@
+# ==========================================
+# history.py – 对话历史管理
+# 按模型的 token 预算约束历史长度：
+#   开头的系统人设保持不变（服务端前缀缓存可一直命中）
+#   报时消息只保留最新一条
+#   接近预算时在后台把最早的几轮总结成一条摘要，下一轮开始时替换进历史；仍超预算则直接丢弃最早的几轮
+# ==========================================
+
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .config import current as current_config
+from .utils import log
+
+# LLMWorker 每轮追加的报时消息，如“现在是下午3点5分”
+TIME_MESSAGE = re.compile(r"^现在是(凌晨|早上|下午|晚上)\d+点\d+分$")
+
+# 摘要消息的开头，用于识别历史中已有的摘要
+SUMMARY_PREFIX = "以下是你和主人更早之前对话的摘要："
+
+# 后台总结在线程池中串行执行，同一时间只有一个总结请求
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summary")
+
+def _text(message: dict) -> str:
+    content = message["content"]
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content)
+    return content or ""
+
+def estimate_tokens(messages) -> int:
+    """
+    粗略估计 token 数：中日文约 1 字 1 token，其余约 4 字符 1 token，每条消息另加 4
+    """
+    total = 0
+    for message in messages:
+        text = _text(message)
+        wide = sum(1 for ch in text if ord(ch) >= 0x2E80)
+        total += 4 + wide + (len(text) - wide + 3) // 4
+    return total
+
+def token_budget(model: str = None) -> int:
+    """
+    model 的历史 token 预算：history.model_budgets 中有则取之，否则取 history.max_tokens
+    """
+    history_config = current_config().history
+    model = model or current_config().endpoints.model_id
+    return history_config.model_budgets.get(model, history_config.max_tokens)
+
+def collapse_time_messages(history: list):
+    """
+    报时消息只保留最后一条（原地修改）
+    """
+    indexes = [i for i, message in enumerate(history)
+               if message["role"] == "system" and TIME_MESSAGE.match(_text(message))]
+    for i in reversed(indexes[:-1]):
+        del history[i]
+
+class HistoryManager:
+    """
+    一份对话历史的管理器；prepare() 在每次把历史发给模型之前调用，原地整理
+    summarize=False 时只丢弃最早的几轮（如图层、截屏助手的历史）
+    """
+
+    def __init__(self, name: str, summarize: bool = True):
+        self.name = name
+        self.summarize = summarize
+        self._lock = threading.Lock()
+        self._pending = None        # (被总结的消息, Future[摘要])
+        self.summaries = 0
+        self.dropped = 0
+
+    def prepare(self, history: list, model: str = None) -> list:
+        """
+        model 为这份历史将要发给的模型（决定 token 预算），如 router.primary_model("reply")
+        """
+        collapse_time_messages(history)
+        self._apply_summary(history)
+        budget = token_budget(model)
+        tokens = estimate_tokens(history)
+        if self.summarize and tokens > budget * current_config().history.summarize_at:
+            self._start_summary(history)
+        if tokens > budget:
+            self._drop(history, budget)
+        return history
+
+    # -------------- 内部 ------------------
+    def _prefix_length(self, history: list) -> tuple:
+        """
+        不参与整理的开头：系统人设 + 已有的摘要；返回 (长度, 是否含摘要)
+        """
+        length = 1 if history and history[0]["role"] == "system" else 0
+        if len(history) > length and _text(history[length]).startswith(SUMMARY_PREFIX):
+            return length + 1, True
+        return length, False
+
+    def _oldest_turns(self, history: list, start: int, count: int) -> int:
+        """
+        从 start 起取约 count 条消息，终点对齐到下一轮的开头，不把一问一答拆开
+        """
+        end = min(len(history) - 1, start + count)
+        while end < len(history) - 1 and history[end]["role"] == "assistant":
+            end += 1
+        return end
+
+    def _drop(self, history: list, budget: int):
+        start, _ = self._prefix_length(history)
+        while estimate_tokens(history) > budget and len(history) - start > 1:
+            end = self._oldest_turns(history, start, 1)
+            if end <= start:
+                break
+            self.dropped += end - start
+            del history[start:end]
+
+    def _start_summary(self, history: list):
+        from .chat import summarize_history     # chat 依赖较多，用到时再导入
+        with self._lock:
+            if self._pending is not None:
+                return
+            start, has_summary = self._prefix_length(history)
+            end = self._oldest_turns(history, start, (len(history) - start) // 2)
+            if end <= start:
+                return
+            messages = history[start:end]
+            previous = _text(history[start - 1])[len(SUMMARY_PREFIX):] if has_summary else None
+            self._pending = (messages, _executor.submit(summarize_history, messages, previous))
+
+    def _apply_summary(self, history: list):
+        with self._lock:
+            if self._pending is None or not self._pending[1].done():
+                return
+            messages, future = self._pending
+            self._pending = None
+        try:
+            summary = future.result()
+        except Exception as e:
+            log(f"{self.name} 历史总结失败：{e}", "warning")
+            return
+        start, has_summary = self._prefix_length(history)
+        # 历史在总结期间被清空或已被截断时，摘要作废
+        if len(history) < start + len(messages) or \
+                any(a is not b for a, b in zip(history[start:start + len(messages)], messages)):
+            return
+        del history[start:start + len(messages)]
+        summary_message = {"role": "system", "content": f"{SUMMARY_PREFIX}{summary}"}
+        if has_summary:
+            history[start - 1] = summary_message
+        else:
+            history.insert(start, summary_message)
+        self.summaries += 1
+        log(f"{self.name} 历史已总结 {len(messages)} 条消息", "info")
+
+# 各份历史的管理器；情感分析每次只发送当前这一句，它的记录不进入对话，不需要按 token 预算整理
+chat_history = HistoryManager("对话")
+layers_history = HistoryManager("立绘图层", summarize=False)
+screen_history = HistoryManager("截屏助手", summarize=False)
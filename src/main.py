@@ -7,12 +7,12 @@ from PyQt5.QtWidgets import QApplication, QLabel, QSystemTrayIcon, QMenu, QActio
 from PyQt5.QtGui import QPixmap, QIcon, QImage, QFont, QPainter, QFontDatabase, QColor
 from PyQt5.QtCore import Qt, QTimer, QThread, pyqtSignal, QEvent, QRect, QSize, pyqtProperty
 from datetime import datetime
-from src import chat, generate, utils
-import hashlib
-import cv2
+from concurrent.futures import ThreadPoolExecutor, wait
+from src import calls, chat, config, generate, player, reactions, references, router, sprite, stages, utils, voicecache
+from src import history as histories
+import json
 import threading
 import textwrap
-import os
 import time
 import sys
 
@@ -25,10 +25,16 @@ def wrap_text(text, width=12):
 
 # -------------- 主窗口：ムラサメ ------------------
 class Pet(QLabel):
-    def __init__(self):
+    # 摸头/输入区域的分界线（0.5 倍缩放下的像素，随立绘缩放等比调整）
+    HEAD_BOTTOM = 157
+    INPUT_TOP = 277
+
+    def __init__(self, scale: float = 0.5):
         super().__init__()
+        self.sprite_scale = scale       # 立绘显示缩放（相对 PSD 原始尺寸）
         # 历史记录
         self.history = chat.identity()                                                                  # 第 1 处 chat
+        self.emotion_history = []
         self.embeddings_history = []
 
         # 淡入淡出用 QLabel + QGraphicsOpacityEffect
@@ -51,11 +57,7 @@ class Pet(QLabel):
         self.setAttribute(Qt.WA_TranslucentBackground)
 
         # 初始立绘：ムラサメb 便衣+微笑+头发
-        cv_img = generate.generate_fgimage(target="ムラサメb",
-                                           embeddings_layers=[1717, 1475, 1261])
-        pixmap = self.cvimg_to_qpixmap(cv_img)
-        pixmap = pixmap.scaled(pixmap.width(
-        ) // 2, pixmap.height() // 2, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        pixmap = QPixmap.fromImage(sprite.get_sprite("ムラサメb", [1717, 1475, 1261], scale=self.sprite_scale))
         self.setPixmap(pixmap)
         self.resize(pixmap.size())
 
@@ -88,6 +90,14 @@ class Pet(QLabel):
         self.typing_interval = 40   # ms
         self._typing_index = 0
         self.typing_prefix = ""     # 如「丛雨：」
+        self._streaming = False     # 流式回复进行中：文字随生成追加
+
+        # 语音队列：流式回复逐句到达，按顺序播放
+        self.voice_queue = []
+        self._voice = None
+        self.voice_timer = QTimer()
+        self.voice_timer.timeout.connect(self._voice_step)
+        self.audio = player.PcmPlayer(self)     # 流式合成的语音边收边播
 
         # 中文输入模式
         self.setAttribute(Qt.WA_InputMethodEnabled, True)
@@ -118,28 +128,24 @@ class Pet(QLabel):
     # -------------- OpenCV ↔ Qt ------------------
     def cvimg_to_qpixmap(self, cv_img):
         """
-        BGRA numpy → QPixmap（Qt 可直接显示）
+        BGRA（预乘 alpha）numpy → QPixmap（Qt 可直接显示）
         """
         if cv_img.shape[2] == 4:
-            cv_img_bgra = cv2.cvtColor(cv_img, cv2.COLOR_RGBA2BGRA)
-            height, width, channel = cv_img_bgra.shape
-            bytes_per_line = 4 * width
-            qimg = QImage(cv_img_bgra.data, width, height,
-                          bytes_per_line, QImage.Format_RGBA8888)
-            return QPixmap.fromImage(qimg)
+            return QPixmap.fromImage(sprite.cvimg_to_qimage(cv_img))
 
     # -------------- 鼠标交互 ------------------
     def start_move(self, event):
         """
         左键：
-          - 头顶区域(0~156px) → 摸头判定
+          - 头顶区域(0~156px，0.5 倍缩放下) → 摸头判定
           - 下方区域(>277px) → 打开输入框
         中键：拖拽移动
         """
         if event.button() == Qt.LeftButton:
             rect = self.rect()
+            ratio = self.sprite_scale / 0.5
 
-            if event.y() < 157:
+            if event.y() < self.HEAD_BOTTOM * ratio:
                 self.touch_head = True
                 self.head_press_x = event.x()
                 self.setCursor(Qt.OpenHandCursor)
@@ -147,7 +153,7 @@ class Pet(QLabel):
                 self.touch_head = False
                 self.head_press_x = None
                 self.setCursor(Qt.ArrowCursor)
-            if event.y() > 277:
+            if event.y() > self.INPUT_TOP * ratio:
                 self.input_mode = True
                 self.input_buffer = ""
                 self.display_text = "【ご主人】\n  ..."
@@ -165,10 +171,11 @@ class Pet(QLabel):
         """
         if self.touch_head and self.head_press_x is not None:
             if abs(event.x() - self.head_press_x) > 50:
-                self.llm_worker = LLMWorker(
-                    "主人摸了摸你的头", self.history, self.emotion_history, self.embeddings_history, role="system")
-                self.llm_worker.finished.connect(self.on_llm_result)
-                self.llm_worker.start()
+                reaction = reactions.reaction_bank.take("headpat")
+                if reaction is not None:
+                    self.play_reaction(reaction)
+                else:
+                    self.start_llm(reactions.REACTION_EVENTS["headpat"], role="system")
                 self.touch_head = False
         if self.offset is not None and event.buttons() == Qt.MiddleButton:
             self.move(self.pos() + event.pos() - self.offset)
@@ -342,8 +349,17 @@ class Pet(QLabel):
     def handle_user_input(self):
         if hasattr(screen_worker, "interrupt_event"):
             screen_worker.interrupt_event.set()     # 打断后台截屏
+        self.start_llm(self.input_buffer, role="user")
+
+    def start_llm(self, prompt: str, role: str):
+        reactions.reaction_bank.notify_activity()       # 推迟后台预生成，不与回复争用接口
         self.llm_worker = LLMWorker(
-            self.input_buffer, self.history, self.emotion_history, self.embeddings_history, role="user")
+            prompt, self.history, self.emotion_history, self.embeddings_history, role=role)
+        self.llm_worker.stream_started.connect(self.begin_stream)
+        self.llm_worker.text_delta.connect(self.stream_text)
+        self.llm_worker.voice_ready.connect(self.queue_voice)
+        self.llm_worker.audio_begin.connect(self.audio.begin)
+        self.llm_worker.audio_chunk.connect(self.audio.feed)
         self.llm_worker.finished.connect(self.on_llm_result)
         self.llm_worker.start()
 
@@ -355,10 +371,15 @@ class Pet(QLabel):
         2. 打字机显示
         3. 换立绘
         """
-        raw_response_md5 = hashlib.md5(raw_response.encode()).hexdigest()
-        QSound.play(f"./voices/{raw_response_md5}.wav")
-        self.show_text(result, typing=True)
+        if self._streaming:
+            # 文字与语音已在生成过程中逐句送达，这里只补全收尾
+            self._streaming = False
+            self._set_stream_text(result)
+        else:
+            # 语音合成好后经 voice_ready（或 audio_chunk）播放，合成失败则只有文字
+            self.show_text(result, typing=True)
         self.latest_response = result
+        reactions.reaction_bank.notify_activity()
         self.input_buffer = ""
         self.preedit_text = ""
         self.history = history
@@ -366,6 +387,55 @@ class Pet(QLabel):
         self.embeddings_history = embeddings_history
         self.switch_image("b", embeddings_layers)
 
+    def play_reaction(self, reaction: reactions.Reaction):
+        """
+        直接播放预生成的回复：记入对话历史，播放语音、显示文字、换立绘
+        """
+        self.history.append({"role": "system", "content": reaction.prompt})
+        self.history.append({"role": "assistant", "content": reaction.reply})
+        result = f"「{wrap_text(reaction.reply)}」"
+        self.queue_voice(reaction.voice)
+        self.show_text(result, typing=True)
+        self.latest_response = result
+        self.switch_image("b", list(reaction.layers))
+
+    # -------------- 流式回复 ------------------
+    def begin_stream(self):
+        self.show_text("", typing=True)
+        self._streaming = True
+
+    def stream_text(self, text: str):
+        """
+        text 为目前已生成的全部回复；打字机从当前位置继续，不重新开始
+        """
+        if self._streaming:
+            self._set_stream_text(f"「{wrap_text(text)}")
+
+    def _set_stream_text(self, full_text: str):
+        self.full_text = full_text
+        self.latest_response = full_text
+        if not self.typing_timer.isActive():
+            self.typing_timer.start(self.typing_interval)
+
+    def queue_voice(self, path: str):
+        self.voice_queue.append(path)
+        if not self.voice_timer.isActive():
+            self._voice_step()
+            self.voice_timer.start(50)
+
+    def _voice_step(self):
+        if self._voice is not None:
+            if not self._voice.isFinished():
+                return
+            # 关闭语音复用时，播放完的临时文件随即删除
+            voicecache.voice_cache.discard(self._voice.fileName())
+            self._voice = None
+        if not self.voice_queue:
+            self.voice_timer.stop()
+            return
+        self._voice = QSound(self.voice_queue.pop(0))
+        self._voice.play()
+
     def keyPressEvent(self, event):
         if self.input_mode:
             if event.key() in (Qt.Key_Return, Qt.Key_Enter):
@@ -397,12 +467,8 @@ class Pet(QLabel):
 
     # -------------- 立绘切换 + 淡入淡出 ------------------
     def switch_image(self, target, embeddings_layers):
-        cv_img = generate.generate_fgimage(
-            target=f"ムラサメ{target}", embeddings_layers=embeddings_layers)
-        pixmap_new = self.cvimg_to_qpixmap(cv_img)
-        pixmap_new = pixmap_new.scaled(
-            pixmap_new.width() // 2, pixmap_new.height() // 2,
-            Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        pixmap_new = QPixmap.fromImage(
+            sprite.get_sprite(f"ムラサメ{target}", embeddings_layers, scale=self.sprite_scale))
 
         pixmap_old = self.pixmap()
         if pixmap_old is None:      # 第一次
@@ -458,23 +524,28 @@ class ScreenWorker(QThread):
             print(self.should_capture, "should_capture")
             if self.should_capture:
                 self.interrupt_event.clear()
-                try:
-                    # 先让视觉模型描述屏幕                                                                   # 第 2 处 chat
-                    response = chat.describe_image()
-                    # 再让“思考助手”决定要不要告诉桌宠                                                         # 第 3 处 chat
-                    des, self.history = chat.think_image(response, self.history)
-                    if des['des']:
-                        print("scr worker：", des['des'])
-                        self.llmworker = LLMWorker(
-                            des['des'], self.history, [], [], role="system", interrupt_event=self.interrupt_event
-                        )
-                        self.screen_result.emit(des['des'])
-
-                        self.llmworker.start()
-                        self.llmworker.wait()
-                finally:
-                    pass
-            time.sleep(30)      # 每 30s 截一次
+                # 用户输入时 interrupt_event 置位，进行中的截屏分析立即放弃
+                with calls.cancel_scope(self.interrupt_event):
+                    try:
+                        # 先让视觉模型描述屏幕                                                               # 第 2 处 chat
+                        response = chat.describe_image()
+                        # 再让“思考助手”决定要不要告诉桌宠                                                     # 第 3 处 chat
+                        histories.screen_history.prepare(self.history, router.router.primary_model("judge"))
+                        des, self.history = chat.think_image(response, self.history)
+                        if des['des']:
+                            print("scr worker：", des['des'])
+                            self.llmworker = LLMWorker(
+                                des['des'], self.history, [], [], role="system", interrupt_event=self.interrupt_event
+                            )
+                            self.screen_result.emit(des['des'])
+
+                            self.llmworker.start()
+                            self.llmworker.wait()
+                    except calls.Cancelled:
+                        print("ScreenWorker interrupted")
+                    except Exception as e:
+                        utils.log(f"截屏分析失败：{e}", "error")
+            time.sleep(config.current().screen_interval)   # 截屏间隔，默认 30s，可热更新
 
     def stop(self):
         self.running = False
@@ -487,6 +558,11 @@ class ScreenWorker(QThread):
 # -------------- 推理线程（防止 UI 卡死） ------------------
 class LLMWorker(QThread):
     finished = pyqtSignal(str, list, list, list, list, str)
+    stream_started = pyqtSignal()       # 流式回复开始
+    text_delta = pyqtSignal(str)        # 目前已生成的全部回复
+    voice_ready = pyqtSignal(str)       # 语音已合成（文件路径）；流式回复逐句、按句子顺序发出
+    audio_begin = pyqtSignal()          # 流式合成：一段新的 wav 开始，之后是它的数据块
+    audio_chunk = pyqtSignal(bytes)     # 流式合成：收到的音频数据块
 
     def __init__(self, prompt, history, emotion_history, embeddings_history, role="user", interrupt_event=None):
         super().__init__()
@@ -498,6 +574,16 @@ class LLMWorker(QThread):
         self.interrupt_event = interrupt_event
 
     def run(self):
+        # 本线程及其派生任务发出的模型调用都与中断事件绑定，置位后立即放弃等待
+        with calls.cancel_scope(self.interrupt_event):
+            try:
+                self.respond()
+            except calls.Cancelled:
+                print("LLMWorker interrupted")
+            except Exception as e:
+                utils.log(f"回复生成失败：{e}", "error")
+
+    def respond(self):
         try:
             t_start = time.time()
             # 给 AI 报时
@@ -513,11 +599,25 @@ class LLMWorker(QThread):
                 period = "晚上"
             self.history.append(
                 {"role": "system", "content": f"现在是{period}{hour}点{minute}分"})
+            # 按将要使用的模型的 token 预算整理历史：旧的报时消息只留一条，过长时总结或丢弃最早的几轮
+            reply_kind = "fused" if config.current().fused else "stream" if config.current().streaming else "reply"
+            histories.chat_history.prepare(self.history, router.router.primary_model(reply_kind))
+            histories.layers_history.prepare(self.embeddings_history, router.router.primary_model("layers"))
 
             if self.interrupt_event and self.interrupt_event.is_set():
                 print("LLMWorker interrupted before start")
                 return
 
+            if config.current().fused:
+                fused = chat.fused_query(self.prompt, self.history, self.role)
+                if fused is not None:
+                    self.run_fused(fused[0], t_start)
+                    return
+
+            if config.current().streaming:
+                self.run_stream()
+                return
+
             # 1. 文本生成                                                                                 # 第 4 处 chat
             response, history = chat.query(
                 prompt=self.prompt,
@@ -529,55 +629,206 @@ class LLMWorker(QThread):
                 print("LLMWorker interrupted before start")
                 return
 
-            # 2. 中译日
-            translated = chat.get_translate(response)                                                   # 第 5 处 chat
+            # 2~5. 后处理：翻译、情感、立绘图层并行，语音合成等待翻译与情感                              # 第 5~8 处 chat
+            graph = stages.StageGraph("reply")
+            graph.add("translate", lambda: chat.get_translate(response))
+            graph.add("emotion", lambda: chat.get_emotion(
+                f"用户：{self.prompt}\n丛雨：{response}", self.emotion_history))
+            graph.add("layers", lambda: chat.get_embedings_layers(response, "b", self.embeddings_history))
+            # 语音合成只在此提交，不等它完成：文字先显示，语音合成好即播放
+            graph.add("tts", lambda translate, emotion: self.speak(translate, emotion[0]),
+                      deps=("translate", "emotion"))
+            try:
+                results = graph.run(cancel=self.interrupt_event)
+            except calls.Cancelled:
+                print("LLMWorker interrupted")
+                return
+            translated = results["translate"]
+            emotion, emotion_history = results["emotion"]
+            embeddings_layers, embeddings_history = results["layers"]
+            embeddings_layers = json.loads(embeddings_layers)
 
             if self.interrupt_event and self.interrupt_event.is_set():
                 print("LLMWorker interrupted before start")
                 return
 
-            # 3. 情感分析                                                                                 # 第 6 处 chat
-            emotion, emotion_history = chat.get_emotion(
-                f"用户：{self.prompt}\n丛雨：{response}", self.emotion_history)
+            print(len(history), "history")
+            print(embeddings_layers, "b")
+            print(time.time() - t_start, "sec")
+            print("Emitting ============")
 
-            if self.interrupt_event and self.interrupt_event.is_set():
-                print("LLMWorker interrupted before start")
-                return
+            result = f"「{wrap_text(response)}」"
+            self.finished.emit(result, history, emotion_history,
+                               embeddings_history, embeddings_layers, translated)
+        finally:
+            pass
 
-            # 4. 语音合成（线程不阻塞）                                                                      # 第 7 处 chat
-            tts_thread = threading.Thread(
-                target=chat.generate_tts, args=(translated, emotion), daemon=True)
-            tts_thread.start()
+    def interrupted(self) -> bool:
+        return self.interrupt_event is not None and self.interrupt_event.is_set()
 
-            if self.interrupt_event and self.interrupt_event.is_set():
-                print("LLMWorker interrupted before start")
-                return
+    def speak(self, text: str, emotion):
+        """
+        整段语音：提交后立即返回，不阻塞文字显示；流式合成时边收边播，否则合成好整段再播
+        """
+        if config.current().voices.streaming:
+            calls.submit(chat.tts_executor(), self.speak_stream, text, emotion)
+        else:
+            self.play_when_ready(chat.synthesize(text, emotion))
 
-            # 5. 立绘图层                                                                                 # 第 8 处 chat
-            embeddings_layers, embeddings_history = chat.get_embedings_layers(
-                response, "b", self.embeddings_history)
+    def speak_stream(self, text: str, emotion):
+        """
+        流式合成：音频块一到就发出；合成失败只记录日志，本轮只显示文字
+        """
+        t_start = time.perf_counter()
+        begun = False
+        try:
+            for chunk in chat.stream_tts(text, emotion):
+                if self.interrupted():
+                    return
+                if not begun:
+                    stages.latency.record("tts.first_chunk", time.perf_counter() - t_start)
+                    self.audio_begin.emit()
+                    begun = True
+                self.audio_chunk.emit(chunk)
+            stages.latency.record("tts", time.perf_counter() - t_start)
+        except calls.Cancelled:
+            pass
+        except Exception as e:
+            utils.log(f"语音合成失败，本轮只显示文字：{e}", "warning")
 
-            if self.interrupt_event and self.interrupt_event.is_set():
-                print("LLMWorker interrupted before start")
+    def play_when_ready(self, job):
+        """
+        语音合成任务完成即发出 voice_ready；合成失败只记录日志，本轮只显示文字
+        """
+        def done(future):
+            if self.interrupted():
+                return
+            try:
+                voice = future.result()
+            except calls.Cancelled:
+                return
+            except Exception as e:
+                utils.log(f"语音合成失败，本轮只显示文字：{e}", "warning")
                 return
+            stages.latency.record("tts", voice.seconds)
+            self.voice_ready.emit(voice.path)
 
-            # 等待语音文件落地
-            raw_response_md5 = hashlib.md5(translated.encode()).hexdigest()
-            voice_path = f"../voices/{raw_response_md5}.wav"
+        job.add_done_callback(done)
 
-            while not os.path.exists(voice_path):
-                time.sleep(0.1)
+    def run_fused(self, fused, t_start: float):
+        """
+        合并请求已给出回复、翻译、情感与图层，只剩语音合成
+        """
+        stages.latency.record("fused.query", time.time() - t_start)
+        if self.interrupted():
+            return
+        self.speak(fused.translation, fused.emotion)
+        self.finished.emit(f"「{wrap_text(fused.reply)}」", self.history, self.emotion_history,
+                           self.embeddings_history, fused.layers, fused.translation)
 
-            print(len(history), "history")
-            print(embeddings_layers, "b")
-            print(time.time() - t_start, "sec")
-            print("Emitting ============")
+    def run_stream(self):
+        """
+        流式回复：文本边生成边发出；每凑齐一句就提交翻译，翻译完成后按句子顺序合成语音
+        情感取自第一句，整段回复共用同一参考音色；立绘图层在回复结束后按全文选择
+        流式合成时，轮到合成时已翻译好的几句合并成一次请求（第一句通常单独合成，尽快出声）
+        """
+        self.stream_started.emit()
+        splitter = chat.SentenceSplitter()
+        pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="reply")     # 翻译、情感
+        tts = ThreadPoolExecutor(max_workers=1, thread_name_prefix="speak")      # 单线程保证播放顺序
+        translations = []
+        unspoken = []           # 流式合成：已提交翻译、尚未合成的句子
+        unspoken_lock = threading.Lock()
+        emotion_future = None
+
+        def speak(translate_future, emotion_future):
+            try:
+                translated = translate_future.result()
+                emotion, _ = emotion_future.result()
+                if self.interrupted():
+                    return
+                voice = chat.synthesize(translated, emotion).result()
+                stages.latency.record("tts", voice.seconds)
+                if not self.interrupted():
+                    self.voice_ready.emit(voice.path)
+            except calls.Cancelled:
+                pass
+            except Exception as e:
+                utils.log(f"语音合成失败：{e}", "warning")
+
+        def speak_batch():
+            # 每句提交一次；句子已被前一批合并时直接返回
+            with unspoken_lock:
+                if not unspoken:
+                    return
+                first = unspoken[0]
+            wait([first])
+            with unspoken_lock:
+                batch = []
+                while unspoken and unspoken[0].done():
+                    batch.append(unspoken.pop(0))
+            try:
+                text = "".join(future.result() for future in batch)
+                emotion, _ = emotion_future.result()
+            except calls.Cancelled:
+                return
+            except Exception as e:
+                utils.log(f"语音合成失败：{e}", "warning")
+                return
+            if not self.interrupted():
+                self.speak_stream(text, emotion)
+
+        def submit(sentence):
+            nonlocal emotion_future
+            if emotion_future is None:
+                emotion_future = calls.submit(
+                    pool, chat.get_emotion, f"用户：{self.prompt}\n丛雨：{sentence}", self.emotion_history)
+            translate_future = calls.submit(pool, chat.get_translate, sentence)
+            translations.append(translate_future)
+            if config.current().voices.streaming:
+                with unspoken_lock:
+                    unspoken.append(translate_future)
+                calls.submit(tts, speak_batch)
+            else:
+                calls.submit(tts, speak, translate_future, emotion_future)
 
-            result = f"「{wrap_text(response)}」"
-            self.finished.emit(result, history, emotion_history,
+        t_start = time.time()
+        t_first = None
+        response = ""
+        try:
+            for delta in chat.stream_query(self.prompt, self.history, self.role):
+                if self.interrupted():
+                    print("LLMWorker interrupted while streaming")
+                    return
+                if t_first is None:
+                    t_first = time.time() - t_start
+                response += delta
+                self.text_delta.emit(response)
+                for sentence in splitter.feed(delta):
+                    submit(sentence)
+            for sentence in splitter.flush():
+                submit(sentence)
+
+            stages.latency.record("stream.first_token", t_first if t_first is not None else 0.0)
+            stages.latency.record("stream.reply", time.time() - t_start)
+            # 图层选择与尚未完成的翻译同时进行
+            layers_future = calls.submit(pool, chat.get_embedings_layers, response, "b", self.embeddings_history)
+            translated = "".join(future.result() for future in translations)
+            embeddings_layers, embeddings_history = layers_future.result()
+            embeddings_layers = json.loads(embeddings_layers)
+            if self.interrupted():
+                return
+
+            if emotion_future is not None:
+                _, emotion_history = emotion_future.result()
+            else:
+                emotion_history = self.emotion_history
+
+            self.finished.emit(f"「{wrap_text(response)}」", self.history, emotion_history,
                                embeddings_history, embeddings_layers, translated)
         finally:
-            pass
+            pool.shutdown(wait=False, cancel_futures=self.interrupted())
+            tts.shutdown(wait=False, cancel_futures=self.interrupted())
 
 def clear_history(parent):
     """
@@ -591,11 +842,29 @@ def clear_history(parent):
         murasame.emotion_history = []
         murasame.embeddings_history = []
 
+def apply_render_config(render: config.RenderConfig):
+    """
+    按配置调整图层缓存与立绘缓存（在配置监视线程中也会被调用，两者都是线程安全的）
+    """
+    generate.layer_cache.set_budget(render.layer_cache_mb * 1024 * 1024)
+    sprite.sprite_cache.configure(max_entries=render.sprite_cache_entries, disk=render.sprite_disk_cache)
+
 if __name__ == "__main__":
     history = chat.identity()                                                                           # 第 10 处 chat
 
     app = QApplication(sys.argv)
-    murasame = Pet()
+
+    # 立绘合成缓存；config.json 修改后自动应用（scale 需重启生效）
+    apply_render_config(config.current().render)
+    config.on_change(lambda old, new: apply_render_config(new.render))
+    config.watch()
+
+    # 参考音频：启动时登记并检查；SoVITS 在后台预热，不耽误窗口显示
+    references.reference_voices.validate(chat.EMOTIONS)
+    if config.current().voices.warmup:
+        threading.Thread(target=chat.warm_up_tts, name="tts-warmup", daemon=True).start()
+
+    murasame = Pet(scale=config.current().render.scale)
     murasame.move(1200, 400)        # 初始位置
     murasame.show()
 
@@ -613,19 +882,20 @@ if __name__ == "__main__":
     tray_icon.setContextMenu(tray_menu)
     tray_icon.show()
 
-    # 启动问候
-    murasame.show_text(murasame.latest_response, typing=True)
+    # 启动问候：有预生成的问候就直接播放
+    greeting = reactions.reaction_bank.take("greeting")
+    if greeting is not None:
+        murasame.play_reaction(greeting)
+    else:
+        murasame.show_text(murasame.latest_response, typing=True)
+    reactions.reaction_bank.start()       # 空闲时在后台补充预生成的回复
 
     # 后台视觉
-    if utils.get_config()['enable_vl']:
+    if config.current().enable_vl:
         screen_worker = ScreenWorker()
 
         def handle_screen_result(des_text):
-            murasame.llm_worker = LLMWorker(
-                des_text, murasame.history, murasame.emotion_history, murasame.embeddings_history, role="system"
-            )
-            murasame.llm_worker.finished.connect(murasame.on_llm_result)
-            murasame.llm_worker.start()
+            murasame.start_llm(des_text, role="system")
 
         screen_worker.screen_result.connect(handle_screen_result)
         screen_worker.start()
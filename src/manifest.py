@@ -0,0 +1,333 @@
+# ==========================================
+# manifest.py – 立绘图层清单模块
+# 把 PSD 导出的 txt 解析一次，按 layer_id 建索引，并缓存为 JSON 旁路文件
+# 同时记录每个图层 PNG 中不透明像素的最小包围盒，合成时只混合这块区域
+# generate.py（合成）与 chat.py（图层提示词）共用同一份清单
+# ==========================================
+
+import csv
+import json
+import os
+import time
+from dataclasses import dataclass
+import cv2
+import numpy as np
+from typing import Optional
+from .utils import log
+
+FGIMAGES_DIR = "../fgimages"
+TARGETS = ("ムラサメa", "ムラサメb")
+
+# 旁路文件格式版本，字段变化时 +1，旧文件会被自动重建
+MANIFEST_VERSION = 3
+
+# 两次检查源文件（txt 与图层 PNG）是否变化的最短间隔（秒）；检查需要扫描整个 fgimages 目录
+CHECK_INTERVAL = 2.0
+
+# 基础人物所在行区间（用于坐标对齐，沿用原 generate.py 的切片）
+BASE_ROWS = {
+    "ムラサメa": slice(57, 65),
+    "ムラサメb": slice(47, 51),
+}
+
+# -------------- 图层目录（提示词用） ------------------
+# 分类顺序即返回顺序：基础人物 → 表情 → 额外装饰 → 头发
+LAYER_CATALOG = {
+    "ムラサメa": {
+        "基础人物": [
+            (1957, "睡衣，双手插在腰间"), (1956, "睡衣，两手自然下垂"),
+            (1979, "便衣1，双手插在腰间"), (1978, "便衣1，两手自然下垂"),
+            (1953, "校服，双手插在腰间"), (1952, "校服，两手自然下垂"),
+            (1951, "便衣2，双手插在腰间"), (1950, "便衣2，两手自然下垂"),
+        ],
+        "表情": [
+            (1996, "惊奇，闭着嘴（泪）"), (1995, "伤心，眼睛看向镜头（泪）"), (1994, "伤心，眼睛看向别处（泪）"),
+            (1993, "叹气（泪）"), (1992, "欣慰（泪）"), (1991, "高兴（泪）"), (2009, "高兴，闭眼（泪）"),
+            (1989, "失望，闭眼（泪）"), (1988, "叹气，眼睛看向别处（泪）"), (1987, "害羞，腼腆（泪）"),
+            (1986, "惊奇，张着嘴（泪）"), (1976, "困惑，真挚"), (1975, "疑惑，愣住"), (1974, "愣住，焦急，真挚"),
+            (1973, "愤怒，困惑"), (1972, "困惑，羞涩"), (1971, "寂寞 ，羞涩"), (1970, "真挚，寂寞，思考"),
+            (1969, "困惑，愣住，羞涩"), (1968, "困惑，寂寞，羞涩"), (1967, "困惑"), (1966, "困惑，笑容，羞涩"),
+            (1965, "笑容，困惑"), (1964, "笑容"), (1963, "笑容"), (1935, "紧张"), (1904, "嘿嘿嘿"),
+            (1880, "达观"), (1856, "恐惧"), (1822, "严肃"), (1801, "超级不满"), (1768, "极度不满"),
+            (1738, "孩子气"), (1714, "疑惑"), (1690, "愣住"), (1668, "窃笑2"), (1644, "窃笑"),
+            (1620, "愤怒"), (1596, "困惑"), (1572, "思考"), (1548, "真挚"), (1528, "寂寞"),
+            (1504, "羞涩2"), (1480, "羞涩"), (1455, "腼腆"), (1430, "焦急2"), (1399, "焦急"),
+            (1368, "惊讶"), (1337, "愣住"), (1316, "笑容1"), (1292, "平静"),
+        ],
+        "额外装饰": [
+            (1940, "叹气的装饰"), (1958, "腮红（有些害羞）"),
+        ],
+        "头发": [
+            (1273, "穿便衣2时必选的图层"), (1959, "穿除便衣2时必选的图层"),
+        ],
+    },
+    "ムラサメb": {
+        "基础人物": [
+            (1718, "睡衣"), (1717, "便衣"), (1716, "校服"), (1715, "便衣2"),
+        ],
+        "表情": [
+            (1755, "伤心（泪）"), (1754, "有些生气，指责（泪）"), (1753, "闭眼（泪）"), (1752, "害羞（泪）"),
+            (1751, "失落（泪）"), (1750, "欣慰，高兴（泪）"), (1749, "高兴（泪）"), (1748, "欣慰，高兴，闭眼（泪）"),
+            (1747, "惊奇（泪）"), (1787, "大哭"), (1765, "大哭2"), (1745, "高兴2（泪）"), (1733, "悲伤，害羞"),
+            (1732, "撒娇，愤怒尖叫，眯眼"), (1731, "愤怒尖叫，认真，惊讶"), (1730, "愤怒尖叫，悲伤，认真"),
+            (1729, "悲伤，撒娇，抬眼"), (1728, "悲伤，害羞，认真"), (1727, "惊讶，基础，抬眼"), (1726, "悲伤"),
+            (1725, "悲伤，笑脸2，微笑"), (1724, "笑脸2，眯眼"), (1723, "悲伤"), (1722, "笑脸2，微笑"),
+            (1721, "笑脸2"), (1704, "达观"), (1681, "认真脸2"), (1710, "超级生气"), (1641, "愤怒尖叫"),
+            (1616, "抬眼，害羞"), (1712, "不满，哼哼唧唧2"), (1711, "不满，哼哼唧唧"), (1524, "认真"),
+            (1505, "瞪大眼睛，惊讶"), (1475, "撒娇"), (1452, "眯眼"), (1429, "悲伤"), (1406, "害羞"),
+            (1376, "惊讶"), (1352, "微笑"), (1329, "笑脸2"), (1306, "平静"),
+        ],
+        "额外装饰": [
+            (1708, "不满时脸色阴沉的装饰"), (1719, "腮红（有些害羞）"),
+        ],
+        "头发": [
+            (1261, "头发（必选）"),
+        ],
+    },
+}
+
+# 提示词中的示例返回值
+LAYER_EXAMPLES = {
+    "ムラサメa": [1953, 1801, 1959],
+    "ムラサメb": [1718, 1475, 1261],
+}
+
+# 基础人物 → 必须搭配的头发（未列出的 target 头发只有一种）
+BASE_HAIR = {
+    "ムラサメa": {1957: 1959, 1956: 1959, 1979: 1959, 1978: 1959,
+                  1953: 1959, 1952: 1959, 1951: 1273, 1950: 1273},
+}
+
+@dataclass(frozen=True)
+class LayerRecord:
+    """
+    单个图层：PSD 坐标/尺寸、所属分组、PNG 路径，以及目录中的分类与描述
+    bbox: 不透明像素的包围盒 (x, y, w, h)，相对图层左上角；全透明时 w = h = 0
+    """
+    layer_id: int
+    name: str
+    left: int
+    top: int
+    width: int
+    height: int
+    group: Optional[int]
+    path: str
+    bbox: tuple
+    category: Optional[str] = None
+    description: Optional[str] = None
+
+@dataclass(frozen=True)
+class LayerManifest:
+    """
+    一套立绘资源的图层清单
+    origin: 基础人物左上角，所有图层坐标以此为原点
+    layers: layer_id → LayerRecord
+    categories: 分类 → layer_id 元组（按提示词顺序）
+    source_mtime_ns: 构建时源文件的最新 mtime，成品立绘缓存与图集以此判断是否过期
+    """
+    target: str
+    origin: tuple
+    layers: dict
+    categories: dict
+    source_mtime_ns: int = 0
+
+    def offset(self, layer_id: int) -> tuple:
+        """
+        图层相对 origin 的左上角坐标
+        """
+        record = self.layers[layer_id]
+        return record.left - self.origin[0], record.top - self.origin[1]
+
+    def canvas_size(self, layer_ids) -> tuple:
+        """
+        合成 layer_ids 所需的画布大小 (宽, 高) = 最大右下坐标
+        """
+        right = max(self.offset(i)[0] + self.layers[i].width for i in layer_ids)
+        bottom = max(self.offset(i)[1] + self.layers[i].height for i in layer_ids)
+        return right, bottom
+
+    def hair_for(self, base: int) -> tuple:
+        """
+        基础人物 base 可搭配的头发图层
+        """
+        rule = BASE_HAIR.get(self.target)
+        if rule is not None:
+            return (rule[base],)
+        return self.categories["头发"]
+
+    def combinations(self, decorations: bool = True):
+        """
+        枚举全部合法图层组合：基础人物 → 表情 → 额外装饰（任意子集）→ 头发
+        """
+        extras = [()]
+        if decorations:
+            for layer_id in self.categories["额外装饰"]:
+                extras += [subset + (layer_id,) for subset in extras]
+        for base in self.categories["基础人物"]:
+            for expression in self.categories["表情"]:
+                for extra in extras:
+                    for hair in self.hair_for(base):
+                        yield (base, expression, *extra, hair)
+
+    def validate(self, layer_ids) -> tuple:
+        """
+        校验模型给出的图层列表：基础人物 → 表情 → 额外装饰（不重复）→ 匹配的头发
+        合法时返回整数元组，否则抛出 ValueError
+        """
+        layer_ids = tuple(int(i) for i in layer_ids)
+        if len(layer_ids) < 3:
+            raise ValueError(f"图层数量不足：{list(layer_ids)}")
+        base, expression, *extras, hair = layer_ids
+        if base not in self.categories["基础人物"]:
+            raise ValueError(f"{base} 不是基础人物")
+        if expression not in self.categories["表情"]:
+            raise ValueError(f"{expression} 不是表情")
+        for layer_id in extras:
+            if layer_id not in self.categories["额外装饰"]:
+                raise ValueError(f"{layer_id} 不是额外装饰")
+        if len(set(extras)) != len(extras):
+            raise ValueError(f"额外装饰重复：{extras}")
+        if hair not in self.hair_for(base):
+            raise ValueError(f"头发 {hair} 与基础人物 {base} 不匹配")
+        return layer_ids
+
+    def layer_prompt(self) -> str:
+        """
+        生成“供你参考的图层有”之后的图层说明，每个分类一行
+        """
+        lines = []
+        for category, layer_ids in self.categories.items():
+            items = "；".join(f"{i}：{self.layers[i].description}" for i in layer_ids)
+            lines.append(f"{category} >> {items}")
+        return "\n".join(lines)
+
+# -------------- 解析 ------------------
+def _source_path(target: str) -> str:
+    return f"{FGIMAGES_DIR}/{target}.txt"
+
+def _sidecar_path(target: str) -> str:
+    return f"{FGIMAGES_DIR}/{target}.manifest.json"
+
+def source_mtime_ns(target: str) -> int:
+    """
+    txt 与该 target 全部图层 PNG 中最新的 mtime：换了图层图片，包围盒要重新计算，
+    成品立绘缓存与图集（sprite.py）也随之失效
+    """
+    mtime_ns = os.stat(_source_path(target)).st_mtime_ns
+    prefix = f"{target}_"
+    with os.scandir(FGIMAGES_DIR) as entries:
+        for entry in entries:
+            if entry.name.startswith(prefix) and entry.name.endswith(".png"):
+                mtime_ns = max(mtime_ns, entry.stat().st_mtime_ns)
+    return mtime_ns
+
+def _parse_source(target: str) -> dict:
+    """
+    解析 PSD 导出的 txt（utf-16 le 是 PhotoShop 默认），返回可直接写入旁路文件的 dict
+    """
+    with open(_source_path(target), encoding='utf-16 le') as cf:
+        infos = list(csv.reader(cf, delimiter='\t'))    # 每行：图层名/坐标/尺寸/PNG 路径等
+
+    # 基础人物坐标（用于整体偏移归一化）
+    all_base = [(int(x[2]), int(x[3])) for x in infos[BASE_ROWS[target]]]
+    origin = [min(pos[0] for pos in all_base), min(pos[1] for pos in all_base)]
+
+    layers = []
+    for x in infos:
+        # 跳过表头、画布尺寸行和分组行（layer_type 为 2）
+        if len(x) < 11 or not x[9].isdigit() or x[0] != "0":
+            continue
+        layers.append({
+            "layer_id": int(x[9]),
+            "name": x[1],
+            "left": int(x[2]),
+            "top": int(x[3]),
+            "width": int(x[4]),
+            "height": int(x[5]),
+            "group": int(x[10]) if x[10].isdigit() else None,
+            "path": f"{FGIMAGES_DIR}/{target}_{x[9]}.png",
+        })
+    for layer in layers:
+        layer["bbox"] = _opaque_bbox(layer["path"])
+    return {"origin": origin, "layers": layers}
+
+def _opaque_bbox(path: str) -> list:
+    """
+    PNG 中 alpha > 0 像素的最小包围盒；没有 alpha 通道时即整张图
+    """
+    image = cv2.imdecode(np.fromfile(path, dtype=np.uint8), -1)     # -1 保留 alpha
+    if image is None:
+        log(f"图层 PNG 无法读取：{path}", "warning")
+        return [0, 0, 0, 0]
+    if image.ndim < 3 or image.shape[2] < 4:
+        return [0, 0, image.shape[1], image.shape[0]]
+    return list(cv2.boundingRect(image[..., 3]))
+
+def _load_sidecar(target: str, mtime_ns: int):
+    """
+    读取旁路文件；版本或源文件（txt 与图层 PNG）mtime 不符时返回 None
+    """
+    try:
+        with open(_sidecar_path(target), "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if data.get("version") != MANIFEST_VERSION or data.get("source_mtime_ns") != mtime_ns:
+        return None
+    return data
+
+def _save_sidecar(target: str, mtime_ns: int, data: dict):
+    payload = {"version": MANIFEST_VERSION, "target": target, "source_mtime_ns": mtime_ns, **data}
+    tmp_path = _sidecar_path(target) + ".tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False)
+        os.replace(tmp_path, _sidecar_path(target))
+    except OSError as e:
+        log(f"图层清单旁路文件写入失败：{e}", "warning")
+
+def _build(target: str, data: dict, mtime_ns: int) -> LayerManifest:
+    catalog = {layer_id: (category, description)
+               for category, items in LAYER_CATALOG[target].items()
+               for layer_id, description in items}
+    layers = {}
+    for item in data["layers"]:
+        category, description = catalog.get(item["layer_id"], (None, None))
+        item = {**item, "bbox": tuple(item["bbox"])}
+        layers[item["layer_id"]] = LayerRecord(**item, category=category, description=description)
+
+    categories = {}
+    for category, items in LAYER_CATALOG[target].items():
+        missing = [layer_id for layer_id, _ in items if layer_id not in layers]
+        if missing:
+            raise ValueError(f"{target} 图层目录中的 {missing} 在 {_source_path(target)} 中不存在")
+        categories[category] = tuple(layer_id for layer_id, _ in items)
+
+    return LayerManifest(target=target, origin=tuple(data["origin"]),
+                         layers=layers, categories=categories, source_mtime_ns=mtime_ns)
+
+# -------------- 对外接口 ------------------
+_manifests = {}     # target → (LayerManifest, 上次检查源文件的时间)
+
+def get_manifest(target: str) -> LayerManifest:
+    """
+    返回 target 的图层清单。进程内只解析一次；
+    每隔 CHECK_INTERVAL 秒检查一次源文件，txt 或图层 PNG 的 mtime 变化时重新解析并重建旁路文件。
+    """
+    assert target in TARGETS
+    now = time.monotonic()
+    cached = _manifests.get(target)
+    if cached is not None and now - cached[1] < CHECK_INTERVAL:
+        return cached[0]
+    mtime_ns = source_mtime_ns(target)
+    if cached is not None and cached[0].source_mtime_ns == mtime_ns:
+        _manifests[target] = (cached[0], now)
+        return cached[0]
+
+    data = _load_sidecar(target, mtime_ns)
+    if data is None:
+        data = _parse_source(target)
+        _save_sidecar(target, mtime_ns, data)
+    manifest = _build(target, data, mtime_ns)
+    _manifests[target] = (manifest, now)
+    return manifest
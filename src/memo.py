@@ -0,0 +1,124 @@
+# ==========================================
+# memo.py – 辅助请求的持久化缓存
+# 翻译、情感、立绘图层这类结果相对固定的请求，按 (用途, 模型, 提示词, 规范化输入) 缓存到 SQLite
+# 提示词或模型变化后键随之变化，旧结果自然失效；过期与超量的条目定期清理
+# ==========================================
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from .config import current as current_config
+from .router import router
+from .utils import log
+
+MEMO_PATH = "../cache/memo.sqlite3"
+
+# 每写入多少条清理一次过期 / 超量条目
+PRUNE_EVERY = 64
+
+def normalize(text: str) -> str:
+    """
+    全角半角统一、去掉首尾空白并合并连续空白
+    """
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+def memo_key(namespace: str, prompt: str, text: str) -> str:
+    # namespace 即路由的调用类型，键中的模型取路由的首选接口
+    model = router.model(router.route(namespace)[0])
+    raw = "\0".join((namespace, model, prompt, normalize(text)))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class MemoCache:
+    """
+    SQLite 缓存：lookup() / store() 以 (namespace, prompt, text) 为键
+    配置取自 config.json 的 memo 段，修改后即时生效
+    """
+
+    def __init__(self, path: str = MEMO_PATH):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._stats = {}        # namespace → {"hits", "misses"}
+
+    def lookup(self, namespace: str, prompt: str, text: str):
+        """
+        命中返回缓存的字符串，未命中或已过期返回 None
+        """
+        memo = current_config().memo
+        if not memo.enabled:
+            return None
+        key = memo_key(namespace, prompt, text)
+        now = time.time()
+        with self._lock:
+            stats = self._stats.setdefault(namespace, {"hits": 0, "misses": 0})
+            row = self._connect().execute(
+                "SELECT value, created FROM memo WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > memo.ttl_days * 86400:
+                stats["misses"] += 1
+                return None
+            self._conn.execute("UPDATE memo SET used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            stats["hits"] += 1
+            return row[0]
+
+    def store(self, namespace: str, prompt: str, text: str, value: str):
+        memo = current_config().memo
+        if not memo.enabled:
+            return
+        key = memo_key(namespace, prompt, text)
+        now = time.time()
+        with self._lock:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO memo (key, namespace, value, created, used) VALUES (?, ?, ?, ?, ?)",
+                (key, namespace, value, now, now))
+            self._writes += 1
+            if self._writes % PRUNE_EVERY == 0:
+                self._prune(memo, now)
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        """
+        各用途的命中数、未命中数与命中率，以及库中条目数
+        """
+        with self._lock:
+            result = {namespace: {**stats, "hit_rate": stats["hits"] / max(1, stats["hits"] + stats["misses"])}
+                      for namespace, stats in self._stats.items()}
+            if self._conn is not None:
+                result["entries"] = self._conn.execute("SELECT COUNT(*) FROM memo").fetchone()[0]
+            return result
+
+    def clear(self):
+        with self._lock:
+            self._connect().execute("DELETE FROM memo")
+            self._conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            # 多个工作线程共用一个连接，由 self._lock 串行化
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")     # WAL 下提交不等待落盘，命中时更新 used 很便宜
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS memo (
+                key TEXT PRIMARY KEY, namespace TEXT NOT NULL, value TEXT NOT NULL,
+                created REAL NOT NULL, used REAL NOT NULL)""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS memo_used ON memo (used)")
+            self._prune(current_config().memo, time.time())
+            self._conn.commit()
+        return self._conn
+
+    def _prune(self, memo, now: float):
+        expired = self._conn.execute(
+            "DELETE FROM memo WHERE created < ?", (now - memo.ttl_days * 86400,)).rowcount
+        # 超出上限时淘汰最久未使用的条目
+        excess = self._conn.execute(
+            "DELETE FROM memo WHERE key IN (SELECT key FROM memo ORDER BY used DESC LIMIT -1 OFFSET ?)",
+            (memo.max_entries,)).rowcount
+        if expired or excess:
+            log(f"辅助请求缓存清理：过期 {expired} 条，超量 {excess} 条", "info")
+
+memo_cache = MemoCache()
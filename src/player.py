@@ -0,0 +1,91 @@
+# ==========================================
+# player.py – 流式语音播放
+# 合成中的语音逐块到达：解析出 wav 文件头后立即开始播放，之后的 PCM 先进内存缓冲，
+# 再按声卡能接收的量写入（QAudioOutput 推模式），不落盘，也不阻塞界面线程
+# ==========================================
+
+from PyQt5.QtCore import QObject, QTimer
+from PyQt5.QtMultimedia import QAudioFormat, QAudioOutput
+from .utils import log
+from .voicecache import wav_format
+
+# 缓冲区向声卡写入的间隔（毫秒）
+PUMP_INTERVAL = 20
+
+class PcmPlayer(QObject):
+    """
+    begin() 开始一段新的 wav 流，feed() 逐块送入数据；多段依次排队播放
+    只能在界面线程中调用，工作线程通过信号转交
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._output = None
+        self._device = None
+        self._format = None         # (声道数, 采样率, 采样字节数)
+        self._header = None         # 正在接收的文件头；None 表示当前在接收 PCM
+        self._discard = False       # 当前这段数据无法播放：直到下一次 begin() 前收到的都丢弃
+        self._pending = bytearray()
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self._pump)
+
+    def begin(self):
+        self._header = bytearray()
+        self._discard = False
+
+    def feed(self, data: bytes):
+        if self._discard:
+            return
+        if self._header is not None:
+            self._header += data
+            try:
+                parsed = wav_format(bytes(self._header))
+            except ValueError as e:
+                log(f"流式语音数据无法播放：{e}", "warning")
+                self._header = None
+                self._discard = True
+                return
+            if parsed is None:
+                return
+            channels, rate, width, offset = parsed
+            data = bytes(self._header[offset:])
+            self._header = None
+            self._open(channels, rate, width)
+        self._pending += data
+        self._pump()
+        if self._pending and not self._timer.isActive():
+            self._timer.start(PUMP_INTERVAL)
+
+    # -------------- 内部 ------------------
+    def _open(self, channels: int, rate: int, width: int):
+        if self._output is not None and self._format == (channels, rate, width):
+            return
+        if self._output is not None:
+            # 格式变化（换了模型）：等已缓冲的部分播完再切换会拖慢新语音，直接切换
+            self._output.stop()
+            self._pending.clear()
+        audio_format = QAudioFormat()
+        audio_format.setCodec("audio/pcm")
+        audio_format.setChannelCount(channels)
+        audio_format.setSampleRate(rate)
+        audio_format.setSampleSize(width * 8)
+        audio_format.setByteOrder(QAudioFormat.LittleEndian)
+        audio_format.setSampleType(QAudioFormat.SignedInt if width > 1 else QAudioFormat.UnSignedInt)
+        self._output = QAudioOutput(audio_format, self)
+        self._device = self._output.start()
+        self._format = (channels, rate, width)
+
+    def _pump(self):
+        if self._device is None or not self._pending:
+            self._timer.stop()
+            return
+        frame = self._format[0] * self._format[2]
+        size = min(self._output.bytesFree(), len(self._pending))
+        size -= size % frame
+        if size <= 0:
+            return
+        written = self._device.write(bytes(self._pending[:size]))
+        if written > 0:
+            del self._pending[:written]
+        if not self._pending:
+            self._timer.stop()
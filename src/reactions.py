@@ -0,0 +1,180 @@
+# ==========================================
+# reactions.py – 常见事件的预生成回复
+# 摸头、启动问候这类提示词固定的事件，预先生成几条完整回复（文字、翻译、情感、立绘图层、语音）放进池子
+# 事件发生时直接取一条，不必等模型与 SoVITS；取走的回复不再使用，空闲时在后台补上新的
+# 池子保存在 cache/reactions.json，重启后仍可用
+# ==========================================
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from . import calls
+from .config import current as current_config
+from .manifest import get_manifest
+from .utils import log
+
+BANK_PATH = "../cache/reactions.json"
+
+# 事件 → 发给模型的提示词（以 system 消息发出）
+REACTION_EVENTS = {
+    "headpat": "主人摸了摸你的头",
+    "greeting": "主人刚刚打开电脑，和主人打个招呼吧",
+}
+
+# 每个事件记住最近用过的多少条回复，新生成的回复与之重复时丢弃
+RECENT_REPLIES = 20
+
+# 后台线程检查是否空闲的间隔（秒）
+CHECK_INTERVAL = 5.0
+
+@dataclass(frozen=True)
+class Reaction:
+    event: str
+    prompt: str
+    reply: str
+    translation: str
+    emotion: str
+    layers: tuple
+    voice: str          # 语音文件路径（语音缓存中的文件）
+
+class ReactionBank:
+    """
+    take(event) 取一条预生成的回复，池子为空时返回 None
+    start() 启动后台补充线程：距上次活动超过 reactions.idle_seconds 才开始生成，有新活动时立即放弃
+    """
+
+    def __init__(self, path: str = BANK_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._pools = None          # event → deque[Reaction]
+        self._recent = {event: deque(maxlen=RECENT_REPLIES) for event in REACTION_EVENTS}
+        self._last_activity = time.monotonic()
+        self._cancel = threading.Event()
+        self._thread = None
+        self.served = 0
+        self.generated = 0
+
+    def take(self, event: str):
+        if not current_config().reactions.enabled:
+            return None
+        self.notify_activity()
+        with self._lock:
+            pool = self._load().get(event)
+            while pool:
+                reaction = pool.popleft()
+                # 语音文件可能已被语音缓存淘汰，或是关闭复用时上次运行留下、已被清除的临时文件
+                if os.path.exists(reaction.voice):
+                    self._recent[event].append(reaction.reply)
+                    self._save()
+                    self.served += 1
+                    return reaction
+            self._save()
+        return None
+
+    def notify_activity(self):
+        """
+        用户或桌宠有动作：推迟后台生成，进行中的生成立即放弃
+        """
+        self._last_activity = time.monotonic()
+        self._cancel.set()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="reactions", daemon=True)
+            self._thread.start()
+
+    def stats(self) -> dict:
+        with self._lock:
+            pools = {event: len(pool) for event, pool in self._load().items()}
+        return {"pools": pools, "served": self.served, "generated": self.generated}
+
+    # -------------- 内部 ------------------
+    def _load(self) -> dict:
+        if self._pools is not None:
+            return self._pools
+        self._pools = {event: deque() for event in REACTION_EVENTS}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return self._pools
+        except (OSError, ValueError) as e:
+            log(f"预生成回复读取失败，重新生成：{e}", "warning")
+            return self._pools
+        for event, items in saved.items():
+            if event not in REACTION_EVENTS:
+                continue
+            for item in items:
+                reaction = Reaction(**{**item, "layers": tuple(item["layers"])})
+                # 提示词改过的旧回复作废
+                if reaction.prompt == REACTION_EVENTS[event]:
+                    self._pools[event].append(reaction)
+        return self._pools
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        data = {event: [asdict(reaction) for reaction in pool] for event, pool in self._pools.items()}
+        temp = f"{self.path}.tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(temp, self.path)
+
+    def _next_event(self):
+        """
+        最缺回复的事件；都已满时返回 None
+        """
+        size = current_config().reactions.pool_size
+        with self._lock:
+            pools = self._load()
+            event = min(pools, key=lambda name: len(pools[name]))
+            return event if len(pools[event]) < size else None
+
+    def _idle(self) -> bool:
+        return time.monotonic() - self._last_activity >= current_config().reactions.idle_seconds
+
+    def _run(self):
+        while True:
+            time.sleep(CHECK_INTERVAL)
+            # 先清除再判断空闲：之后的 notify_activity 要么让判断不通过，要么让生成立即放弃
+            self._cancel.clear()
+            if not current_config().reactions.enabled or not self._idle():
+                continue
+            event = self._next_event()
+            if event is None:
+                continue
+            try:
+                with calls.cancel_scope(self._cancel):
+                    reaction = self._generate(event)
+            except calls.Cancelled:
+                continue
+            except Exception as e:
+                log(f"预生成回复（{event}）失败：{e}", "warning")
+                continue
+            with self._lock:
+                if reaction.reply in self._recent[event] or \
+                        any(r.reply == reaction.reply for r in self._pools[event]):
+                    continue
+                self._pools[event].append(reaction)
+                self._save()
+                self.generated += 1
+            log(f"预生成回复（{event}）：{reaction.reply}", "info")
+
+    def _generate(self, event: str) -> Reaction:
+        """
+        与非流式回复相同的流程，但使用全新的历史：回复不依赖当时的对话
+        """
+        from . import chat      # chat 依赖较多，用到时再导入
+        prompt = REACTION_EVENTS[event]
+        reply, _ = chat.query(prompt, chat.identity(), role="system")
+        translation = chat.get_translate(reply)
+        emotion, _ = chat.get_emotion(f"用户：{prompt}\n丛雨：{reply}", [])
+        layers, _ = chat.get_embedings_layers(reply, "b", [])
+        # 不合规的图层组合不入库（抛出 ValueError），也不必再合成语音
+        layers = get_manifest("ムラサメb").validate(json.loads(layers))
+        voice = chat.generate_tts(translation, emotion)
+        return Reaction(event, prompt, reply, translation, emotion, layers, voice)
+
+reaction_bank = ReactionBank()
@@ -0,0 +1,152 @@
+# ==========================================
+# references.py – SoVITS 参考音频登记
+# 启动时扫描 models/Murasame_SoVITS/reference_voices/，每种情感一个文件夹：
+#   参考音频（取文件名排序后的第一个）、asr.txt（参考音频的文本）、可选的 aux/（辅助参考音频）
+# 合成时直接查表，不再每次列目录、读文本；文件夹有变化时自动重新扫描
+# ==========================================
+
+import os
+import threading
+import time
+from dataclasses import dataclass
+from .utils import log
+
+REFERENCE_DIR = "../models/Murasame_SoVITS/reference_voices"
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".flac", ".ogg", ".m4a")
+
+# 两次检查文件夹是否变化的最短间隔（秒）
+REFRESH_INTERVAL = 2.0
+
+@dataclass(frozen=True)
+class ReferenceVoice:
+    emotion: str
+    audio: str          # 参考音频的绝对路径
+    text: str           # 参考音频的文本
+    aux: tuple = ()     # 辅助参考音频的绝对路径
+    stamps: tuple = ()  # 登记时各音频（参考音频 + 辅助）的 (大小, 修改时间)
+
+    @property
+    def identity(self) -> str:
+        """
+        语音缓存键中的参考音频部分：换了参考音频（包括同名替换）或文本，同一句子需要重新合成
+        """
+        names = [os.path.basename(self.audio), self.text] + [os.path.basename(path) for path in self.aux]
+        names += [f"{size}:{mtime_ns}" for size, mtime_ns in self.stamps]
+        return "\0".join(names)
+
+def _stamp(path: str) -> tuple:
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+def _audio_files(folder: str) -> list:
+    if not os.path.isdir(folder):
+        return []
+    return sorted(os.path.join(folder, name) for name in os.listdir(folder)
+                  if name.lower().endswith(AUDIO_EXTENSIONS))
+
+class ReferenceRegistry:
+    """
+    情感标签 → ReferenceVoice；get() 取用，首次取用时扫描
+    """
+
+    def __init__(self, directory: str = REFERENCE_DIR):
+        self.directory = directory
+        self._voices = {}
+        self._signature = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, emotion: str) -> ReferenceVoice:
+        self._refresh()
+        voice = self._voices.get(emotion)
+        if voice is None:
+            raise KeyError(f"没有情感“{emotion}”的参考音频（{self.directory}/{emotion}）")
+        return voice
+
+    def emotions(self) -> list:
+        self._refresh()
+        return list(self._voices)
+
+    def validate(self, labels) -> list:
+        """
+        检查 labels 中的每种情感都有可用的参考音频，返回缺少的情感
+        """
+        self._refresh()
+        missing = [label for label in labels if label not in self._voices]
+        if missing:
+            log(f"以下情感缺少参考音频，合成时只显示文字：{'、'.join(missing)}", "error")
+        return missing
+
+    def load(self):
+        """
+        扫描参考音频目录；有问题的文件夹记录日志后跳过
+        """
+        voices = {}
+        names = sorted(os.listdir(self.directory)) if os.path.isdir(self.directory) else []
+        for emotion in names:
+            folder = os.path.join(self.directory, emotion)
+            if not os.path.isdir(folder):
+                continue
+            audio = _audio_files(folder)
+            asr_path = os.path.join(folder, "asr.txt")
+            if not audio:
+                log(f"参考音频文件夹 {folder} 中没有音频文件", "error")
+                continue
+            if not os.path.isfile(asr_path):
+                log(f"参考音频文件夹 {folder} 中缺少 asr.txt", "error")
+                continue
+            with open(asr_path, "r", encoding="utf-8") as f:
+                text = f.read().strip()
+            if not text:
+                log(f"{asr_path} 为空", "error")
+                continue
+            if len(audio) > 1:
+                log(f"{folder} 中有多个音频文件，使用 {os.path.basename(audio[0])}", "warning")
+            aux = _audio_files(os.path.join(folder, "aux"))
+            try:
+                stamps = tuple(_stamp(path) for path in [audio[0]] + aux)
+            except OSError as e:
+                # 扫描途中文件被替换或删除：跳过，文件夹变化会触发下一次扫描
+                log(f"参考音频文件夹 {folder} 读取失败：{e}", "error")
+                continue
+            voices[emotion] = ReferenceVoice(emotion, os.path.abspath(audio[0]), text,
+                                             tuple(os.path.abspath(path) for path in aux), stamps)
+        with self._lock:
+            self._voices = voices
+            self._signature = self._current_signature()
+            self._checked = time.monotonic()
+        log(f"已登记 {len(voices)} 种情感的参考音频", "info")
+
+    # -------------- 内部 ------------------
+    def _current_signature(self) -> tuple:
+        """
+        目录、各情感文件夹、aux/、asr.txt 与各音频的修改时间；增删文件、修改文本或同名替换音频都会改变
+        """
+        paths = [self.directory]
+        if os.path.isdir(self.directory):
+            for emotion in os.listdir(self.directory):
+                folder = os.path.join(self.directory, emotion)
+                aux = os.path.join(folder, "aux")
+                paths += [folder, os.path.join(folder, "asr.txt"), aux]
+                paths += _audio_files(folder) + _audio_files(aux)
+        signature = []
+        for path in paths:
+            try:
+                signature.append((path, os.stat(path).st_mtime_ns))
+            except OSError:
+                signature.append((path, None))
+        return tuple(sorted(signature, key=lambda item: item[0]))
+
+    def _refresh(self):
+        with self._lock:
+            loaded = self._signature is not None
+            if loaded and time.monotonic() - self._checked < REFRESH_INTERVAL:
+                return
+            self._checked = time.monotonic()
+        if loaded and self._current_signature() == self._signature:
+            return
+        if loaded:
+            log("参考音频有变化，重新扫描", "info")
+        self.load()
+
+reference_voices = ReferenceRegistry()
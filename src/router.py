@@ -0,0 +1,220 @@
+# ==========================================
+# router.py – 本地 / 云端文本模型路由
+# 按调用类型（回复、翻译、情感……）决定首选接口，记录各接口的延迟与出错情况
+# 首选接口出错或处于冷却期时自动改用另一个；指定类型的请求超过首选接口的 p95 仍未返回时，
+# 同时向另一个接口发出（对冲请求），取先返回的结果
+# 期限、中断与重试由 calls.execute 负责，每次尝试都重新选路
+# ==========================================
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import httpx
+from openai import APIConnectionError, InternalServerError, RateLimitError
+from . import calls
+from .clients import registry
+from .config import current as current_config
+from .utils import log
+
+ENDPOINT_NAMES = ("cloud", "local")
+
+# 连续失败多少次后进入冷却期
+FAILURES_BEFORE_COOLDOWN = 3
+
+# 样本数不足时不估计 p95，也就不发对冲请求
+MIN_SAMPLES = 10
+
+# 记为接口出错并改用另一个接口的异常：连不上、超时、限流、服务端错误
+# 其他异常（如结构化输出不合规）与接口健康无关，直接抛给调用方
+ENDPOINT_ERRORS = (APIConnectionError, RateLimitError, InternalServerError)
+
+# 首选与对冲请求在单独的线程池中执行：_attempt 本身运行在 calls 的线程池里，共用会在满载时互相等待而死锁
+_executor = None
+_executor_lock = threading.Lock()
+
+def _pool() -> ThreadPoolExecutor:
+    """
+    按 calls.workers 建立：每个调用同时最多有首选与对冲两个请求
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=2 * current_config().calls.workers,
+                                           thread_name_prefix="router")
+        return _executor
+
+class EndpointProfile:
+    """
+    一个接口的延迟与健康状况：延迟按调用类型分别统计（回复与翻译的耗时相差很大），出错率与冷却期按接口统计
+    """
+
+    def __init__(self, name: str, window: int = 50, alpha: float = 0.2):
+        self.name = name
+        self.window = window
+        self.alpha = alpha
+        self._latencies = {}        # kind → deque，最近 window 次延迟（秒）
+        self._ewma = {}             # kind → 平均延迟（秒）
+        self._lock = threading.Lock()
+        self.error_rate = 0.0       # 出错率的滑动平均
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+
+    def record(self, kind: str, seconds: float):
+        with self._lock:
+            self.requests += 1
+            self._latencies.setdefault(kind, deque(maxlen=self.window)).append(seconds)
+            ewma = self._ewma.get(kind)
+            self._ewma[kind] = seconds if ewma is None else self.alpha * seconds + (1 - self.alpha) * ewma
+            self.error_rate *= 1 - self.alpha
+            self.consecutive_failures = 0
+
+    def record_error(self):
+        with self._lock:
+            self.requests += 1
+            self.errors += 1
+            self.error_rate = self.alpha + (1 - self.alpha) * self.error_rate
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= FAILURES_BEFORE_COOLDOWN:
+                self.cooldown_until = time.time() + current_config().routing.cooldown
+
+    def healthy(self) -> bool:
+        return time.time() >= self.cooldown_until
+
+    def p95(self, kind: str):
+        with self._lock:
+            latencies = self._latencies.get(kind, ())
+            if len(latencies) < MIN_SAMPLES:
+                return None
+            ordered = sorted(latencies)
+            return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def stats(self) -> dict:
+        kinds = {kind: {"ewma": ewma, "p95": self.p95(kind)} for kind, ewma in self._ewma.items()}
+        return {"requests": self.requests, "errors": self.errors, "error_rate": self.error_rate,
+                "healthy": self.healthy(), "latency": kinds}
+
+class Router:
+    """
+    call(kind, request)：request(client, model) 发出实际请求，路由决定用哪个接口
+    流式请求同样经过 call，只是延迟记的是收到响应头的时间（与非流式请求分属不同 kind）
+    """
+
+    def __init__(self):
+        self.profiles = {name: EndpointProfile(name) for name in ENDPOINT_NAMES}
+        self._lock = threading.Lock()
+        self.hedges = 0         # 发出的对冲请求数
+        self.hedge_wins = 0     # 对冲请求先返回的次数
+        self.failovers = 0
+
+    def route(self, kind: str) -> list:
+        """
+        kind 的接口顺序：[首选, 备选]；首选处于冷却期而备选正常时对调
+        """
+        routing = current_config().routing
+        primary = routing.policy.get(kind, routing.default)
+        order = [primary] + [name for name in ENDPOINT_NAMES if name != primary]
+        if not self.profiles[order[0]].healthy() and self.profiles[order[1]].healthy():
+            order.reverse()
+        return order if routing.failover else order[:1]
+
+    def model(self, name: str) -> str:
+        endpoints = current_config().endpoints
+        return endpoints.model_id if name == "cloud" else endpoints.local_model_id
+
+    def primary_model(self, kind: str) -> str:
+        """
+        kind 当前首选接口的模型 ID；改用备选接口或发出对冲请求时，实际回复的可能是另一个模型
+        """
+        return self.model(self.route(kind)[0])
+
+    def call(self, kind: str, request):
+        return calls.execute(kind, lambda remaining: self._attempt(kind, request, remaining),
+                             retry_on=ENDPOINT_ERRORS)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = {"hedges": self.hedges, "hedge_wins": self.hedge_wins, "failovers": self.failovers}
+        return {"endpoints": {name: profile.stats() for name, profile in self.profiles.items()}, **counters}
+
+    # -------------- 内部 ------------------
+    def _attempt(self, kind: str, request, remaining: float):
+        """
+        一次尝试：按路由发出请求，必要时对冲或改用另一个接口；remaining 为剩余期限
+        """
+        order = self.route(kind)
+        delay = self.profiles[order[0]].p95(kind)
+        if kind not in current_config().routing.hedge or len(order) < 2 or delay is None:
+            return self._call_in_order(kind, order, request, remaining)
+
+        primary = calls.submit(_pool(), self._timed, kind, order[0], request, remaining)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            try:
+                return primary.result()
+            except ENDPOINT_ERRORS as e:
+                return self._failover(kind, order, request, e, remaining)
+
+        # 首选接口超过 p95 仍未返回：向备选接口发出对冲请求，取先成功的；落后的请求照常完成，结果丢弃
+        with self._lock:
+            self.hedges += 1
+        backup = calls.submit(_pool(), self._timed, kind, order[1], request, remaining - delay)
+        pending = {primary, backup}
+        error = None
+        winner = None
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        result = future.result()
+                    except ENDPOINT_ERRORS as e:
+                        error = e
+                        continue
+                    if future is backup:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    winner = future
+                    return result
+            raise error
+        finally:
+            # 无论成功、出错还是其他异常退出，落后的请求返回后都关闭其连接
+            for future in (primary, backup):
+                if future is not winner:
+                    future.add_done_callback(calls.close_result)
+
+    def _timed(self, kind: str, name: str, request, remaining: float):
+        profile = self.profiles[name]
+        network = current_config().network
+        # 请求超时不超过剩余期限；共用同一连接池
+        client = registry.openai(name).with_options(timeout=httpx.Timeout(
+            min(remaining, network.timeout), connect=min(remaining, network.connect_timeout)))
+        t_start = time.perf_counter()
+        try:
+            result = request(client, self.model(name))
+        except ENDPOINT_ERRORS:
+            profile.record_error()
+            raise
+        profile.record(kind, time.perf_counter() - t_start)
+        return result
+
+    def _call_in_order(self, kind: str, order: list, request, remaining: float):
+        t_start = time.monotonic()
+        try:
+            return self._timed(kind, order[0], request, remaining)
+        except ENDPOINT_ERRORS as e:
+            return self._failover(kind, order, request, e, remaining - (time.monotonic() - t_start))
+
+    def _failover(self, kind: str, order: list, request, error: Exception, remaining: float):
+        if len(order) < 2:
+            raise error
+        with self._lock:
+            self.failovers += 1
+        log(f"{kind}：{order[0]} 接口请求失败（{error}），改用 {order[1]}", "warning")
+        if remaining <= 0:
+            raise error
+        return self._timed(kind, order[1], request, remaining)
+
+router = Router()
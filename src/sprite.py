@@ -0,0 +1,180 @@
+# ==========================================
+# sprite.py – 成品立绘缓存模块
+# 第一层：内存 LRU，缓存已缩放的 QImage
+# 第二层：磁盘，缓存已缩放的 PNG，按 (target, 图层, 缩放) 的哈希命名
+# 若存在预烘焙图集（python -m src.generate bake），优先直接从图集取
+# ==========================================
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+import sys
+import cv2
+from PyQt5 import sip
+from PyQt5.QtGui import QImage
+from .atlas import atlas_key, atlas_path, open_atlas
+from .generate import generate_fgimage
+from .manifest import get_manifest
+from .utils import log
+
+CACHE_DIR = "../cache/sprites"
+
+# 显示用像素格式：预乘 alpha 的 32 位格式是 Qt 光栅绘制的原生格式，转 QPixmap 时无需颜色转换
+DISPLAY_FORMAT = QImage.Format_ARGB32_Premultiplied
+
+# 成品格式版本，合成算法变化时 +1，旧的磁盘缓存自然失效
+SPRITE_VERSION = 3
+
+def cvimg_to_qimage(cv_img) -> QImage:
+    """
+    BGRA numpy → 独立持有数据的 QImage
+    blend_over 在透明画布上叠加得到的颜色已乘过 alpha，按预乘格式包装；
+    按非预乘格式包装再转 DISPLAY_FORMAT 会再乘一次 alpha，半透明边缘发黑
+    """
+    cv_img_rgba = cv2.cvtColor(cv_img, cv2.COLOR_BGRA2RGBA)
+    height, width, _ = cv_img_rgba.shape
+    qimg = QImage(cv_img_rgba.data, width, height, 4 * width, QImage.Format_RGBA8888_Premultiplied)
+    return qimg.copy()      # 脱离 numpy 缓冲区
+
+def atlas_meta(target: str, scale: float) -> dict:
+    """
+    图集索引中的元信息；与当前资源不符的图集会被忽略
+    """
+    return {"target": target, "scale": scale, "sprite_version": SPRITE_VERSION,
+            "source_mtime_ns": get_manifest(target).source_mtime_ns,
+            "format": "ARGB32_Premultiplied", "byteorder": sys.byteorder}
+
+def sprite_key(manifest, embeddings_layers, scale: float) -> str:
+    """
+    成品立绘的缓存键；图层源文件更新后（清单重建）键随之变化
+    """
+    layers = ",".join(str(int(i)) for i in embeddings_layers)
+    raw = f"{SPRITE_VERSION}|{manifest.target}|{layers}|{scale}|{manifest.source_mtime_ns}"
+    return hashlib.md5(raw.encode()).hexdigest()
+
+def render_sprite(target: str, embeddings_layers, scale: float) -> QImage:
+    """
+    完整流程：按显示尺寸合成 → 转 QImage → 显示格式
+    """
+    # 增量合成：返回的画布马上被 cvimg_to_qimage 拷贝，不会被下一次合成覆盖
+    cv_img = generate_fgimage(target, embeddings_layers, scale=scale, incremental=True)
+    return cvimg_to_qimage(cv_img).convertToFormat(DISPLAY_FORMAT)
+
+# -------------- 两级缓存 ------------------
+class SpriteCache:
+    """
+    成品立绘两级缓存：内存 LRU（按条数）+ 磁盘 PNG，之前先查预烘焙图集
+    """
+
+    def __init__(self, max_entries: int, disk: bool = True, atlas: bool = True):
+        self.max_entries = max_entries
+        self.disk = disk
+        self.atlas = atlas
+        self._items = OrderedDict()     # key → QImage
+        self._atlases = {}              # (target, scale) → SpriteAtlas | None
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.atlas_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, target: str, embeddings_layers, scale: float = 0.5) -> QImage:
+        # 校验 target；清单每隔几秒才检查一次源文件，命中时不扫描目录
+        key = sprite_key(get_manifest(target), embeddings_layers, scale)
+        with self._lock:
+            qimg = self._items.get(key)
+            if qimg is not None:
+                self._items.move_to_end(key)
+                self.memory_hits += 1
+                return qimg
+
+        qimg = self._from_atlas(target, embeddings_layers, scale)
+        if qimg is not None:
+            with self._lock:
+                self.atlas_hits += 1
+        else:
+            qimg = self._load(key)
+            if qimg is not None:
+                with self._lock:
+                    self.disk_hits += 1
+            else:
+                qimg = render_sprite(target, embeddings_layers, scale)
+                with self._lock:
+                    self.misses += 1
+                self._save(key, qimg)
+
+        with self._lock:
+            self._items[key] = qimg
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+        return qimg
+
+    def configure(self, max_entries: int, disk: bool, atlas: bool = True):
+        with self._lock:
+            self.max_entries = max_entries
+            self.disk = disk
+            self.atlas = atlas
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"memory_hits": self.memory_hits, "atlas_hits": self.atlas_hits,
+                    "disk_hits": self.disk_hits, "misses": self.misses,
+                    "entries": len(self._items), "max_entries": self.max_entries}
+
+    def _from_atlas(self, target: str, embeddings_layers, scale: float):
+        if not self.atlas:
+            return None
+        with self._lock:
+            if (target, scale) not in self._atlases:
+                atlas = open_atlas(atlas_path(target, scale))
+                if atlas is not None and atlas.meta != atlas_meta(target, scale):
+                    log(f"立绘图集已过期，请重新烘焙：{atlas.path}", "warning")
+                    atlas = None
+                self._atlases[(target, scale)] = atlas
+            atlas = self._atlases[(target, scale)]
+        if atlas is None:
+            return None
+        found = atlas.lookup(atlas_key(embeddings_layers))
+        if found is None:
+            return None
+        width, height, stride, view = found
+        # 直接引用映射内存：不经过 numpy，也不做颜色转换；图集常驻进程，QImage 只读使用
+        return QImage(sip.voidptr(view), width, height, stride, DISPLAY_FORMAT)
+
+    def _path(self, key: str) -> str:
+        return f"{CACHE_DIR}/{key}.png"
+
+    def _load(self, key: str):
+        if not self.disk or not os.path.exists(self._path(key)):
+            return None
+        qimg = QImage(self._path(key))
+        if qimg.isNull():
+            log(f"立绘缓存文件损坏，已忽略：{self._path(key)}", "warning")
+            return None
+        return qimg.convertToFormat(DISPLAY_FORMAT)
+
+    def _save(self, key: str, qimg: QImage):
+        if not self.disk:
+            return
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = f"{self._path(key)}.{threading.get_ident()}.tmp"
+        if qimg.save(tmp_path, "PNG"):
+            os.replace(tmp_path, self._path(key))
+        else:
+            log(f"立绘缓存写入失败：{self._path(key)}", "warning")
+
+# 默认缓存 8 张半尺寸立绘（每张约 4 MB）；可在 config.json 的 render 中调整
+sprite_cache = SpriteCache(max_entries=8)
+
+def get_sprite(target: str, embeddings_layers, scale: float = 0.5) -> QImage:
+    """
+    取成品立绘（已缩放），依次查内存、磁盘，最后才完整合成
+    """
+    return sprite_cache.get(target, embeddings_layers, scale)
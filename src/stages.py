@@ -0,0 +1,85 @@
+# ==========================================
+# stages.py – 回复后处理的阶段依赖图
+# 翻译、情感、立绘图层互不依赖，并行执行；语音合成等待翻译与情感
+# 每个阶段的耗时记入 latency，便于观察关键路径
+# ==========================================
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from . import calls
+
+class StageCancelled(calls.Cancelled):
+    """
+    中断后尚未开始的阶段直接跳过
+    """
+
+class LatencyRecorder:
+    """
+    按阶段名记录最近 window 次耗时（秒）
+    """
+
+    def __init__(self, window: int = 100):
+        self.window = window
+        self._samples = {}      # name → deque
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(name, deque(maxlen=self.window)).append(seconds)
+
+    def summary(self) -> dict:
+        """
+        {name: {"count", "last", "p50", "p95"}}
+        """
+        with self._lock:
+            result = {}
+            for name, samples in self._samples.items():
+                ordered = sorted(samples)
+                result[name] = {"count": len(ordered), "last": samples[-1],
+                                "p50": ordered[len(ordered) // 2],
+                                "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]}
+            return result
+
+latency = LatencyRecorder()
+
+class StageGraph:
+    """
+    阶段依赖图：add(name, fn, deps) 注册阶段，fn 以依赖阶段的结果为关键字参数
+    run() 让每个阶段在依赖完成后立即开始，返回 {name: 结果}；任一阶段出错则抛出该异常
+    """
+
+    def __init__(self, name: str = "reply"):
+        self.name = name
+        self._stages = {}       # name → (fn, deps)，按注册顺序，依赖必须先注册
+        self.timings = {}       # name → 耗时（秒），含 name 本身的总耗时
+
+    def add(self, name: str, fn, deps=()):
+        for dep in deps:
+            if dep not in self._stages:
+                raise ValueError(f"阶段 {name} 依赖的 {dep} 尚未注册")
+        self._stages[name] = (fn, tuple(deps))
+        return self
+
+    def run(self, cancel: threading.Event = None) -> dict:
+        futures = {}
+        t_start = time.perf_counter()
+
+        def execute(name, fn, deps):
+            kwargs = {dep: futures[dep].result() for dep in deps}
+            if cancel is not None and cancel.is_set():
+                raise StageCancelled(name)
+            t_stage = time.perf_counter()
+            result = fn(**kwargs)
+            self.timings[name] = time.perf_counter() - t_stage
+            latency.record(f"{self.name}.{name}", self.timings[name])
+            return result
+
+        # 每个阶段占一个线程，依赖已先提交，等待依赖不会死锁
+        with ThreadPoolExecutor(max_workers=len(self._stages), thread_name_prefix=self.name) as pool:
+            for name, (fn, deps) in self._stages.items():
+                futures[name] = calls.submit(pool, execute, name, fn, deps)
+        self.timings[self.name] = time.perf_counter() - t_start
+        latency.record(self.name, self.timings[self.name])
+        return {name: future.result() for name, future in futures.items()}
@@ -2,7 +2,6 @@
 # utils.py – 工具集模块
 # ==========================================
 
-import json
 from rich.console import Console
 from datetime import datetime
 from sys import _getframe
@@ -46,9 +45,10 @@ def log(event: str, type: str, show: bool = True, save: bool = True):
         with open('latest.log', 'a', encoding='utf-8') as f:
             f.write(f'{logger}\n')
 
-def get_config() -> dict:
+def get_config():
     """
-    读取项目根目录的 config.json
+    项目根目录 config.json 的原始内容（只读，取自 config 模块的缓存快照）
+    新代码请直接使用 config.current() 的类型化字段
     """
-    with open("../config.json", "r", encoding="utf-8") as f:
-        return json.load(f)
\ No newline at end of file
+    from .config import current     # config 依赖本模块的 log，延迟导入避免循环
+    return current().raw
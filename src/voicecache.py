@@ -0,0 +1,282 @@
+# ==========================================
+# voicecache.py – 合成语音的本地缓存
+# 语音文件按 (句子, 情感, 参考音频) 的哈希命名，索引记录在 SQLite：
+#   合成前先查索引，命中则直接返回已有文件
+#   同一键同时只合成一次，其余请求等待它的结果
+#   目录总大小超过 voices.max_mb 时，按最后播放时间淘汰
+# voices.cache 关闭时不查也不登记索引：每次合成写入一个临时文件，播放后由播放方 discard 删除
+# ==========================================
+
+import hashlib
+import io
+import os
+import shutil
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+import wave
+from concurrent.futures import Future, wait
+from . import calls
+from .config import current as current_config
+from .utils import log
+
+VOICE_DIR = "../cache/voices"
+INDEX_PATH = "../cache/voices.sqlite3"
+TRANSIENT_DIR = "../cache/voices/transient"
+
+def voice_key(sentence: str, emotion: str, reference: str) -> str:
+    raw = "\0".join((sentence, emotion, reference))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+# -------------- wav 文件头 ------------------
+def wav_format(data: bytes):
+    """
+    解析 wav 文件头，返回 (声道数, 采样率, 每个采样的字节数, PCM 起始位置)
+    数据还不够解析出文件头时返回 None；不是 wav 时抛出 ValueError
+    """
+    if len(data) < 12:
+        return None
+    if data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        raise ValueError("不是 wav 数据")
+    pos, fmt = 12, None
+    while pos + 8 <= len(data):
+        chunk_id, size = struct.unpack_from("<4sI", data, pos)
+        if chunk_id == b"fmt ":
+            if pos + 24 > len(data):
+                return None
+            _, channels, rate, _, _, bits = struct.unpack_from("<HHIIHH", data, pos + 8)
+            fmt = (channels, rate, bits // 8)
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise ValueError("wav 缺少 fmt 块")
+            return (*fmt, pos + 8)
+        pos += 8 + size + (size & 1)
+    return None
+
+def complete_wav(data: bytes) -> bytes:
+    """
+    流式输出的文件头中长度为 0（或占位值），按实际收到的 PCM 重写文件头
+    """
+    channels, rate, width, offset = wav_format(data)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(channels)
+        f.setsampwidth(width)
+        f.setframerate(rate)
+        f.writeframes(data[offset:])
+    return buffer.getvalue()
+
+class VoiceCache:
+    """
+    fetch(sentence, emotion, reference, synthesize) → wav 文件路径
+    synthesize() 返回 wav 字节，只在未命中且没有同键合成进行中时调用
+    """
+
+    def __init__(self, directory: str = VOICE_DIR, index_path: str = INDEX_PATH,
+                 transient_dir: str = TRANSIENT_DIR):
+        self.directory = directory
+        self.index_path = index_path
+        self.transient_dir = transient_dir
+        self._swept = False         # 上次运行留下的临时文件是否已清除
+        self._conn = None
+        self._lock = threading.Lock()
+        self._inflight = {}         # key → Future[路径]
+        self._stats = {"hits": 0, "misses": 0, "joined": 0, "evicted": 0}
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.wav")
+
+    def fetch(self, sentence: str, emotion: str, reference: str, synthesize) -> str:
+        key = voice_key(sentence, emotion, reference)
+        path, future = self.acquire(key)
+        if path is not None:
+            return path
+        return self._synthesize(key, sentence, emotion, reference, synthesize, future)
+
+    def acquire(self, key: str) -> tuple:
+        """
+        返回 (路径, None)：已缓存，或等到了同键进行中的合成
+        返回 (None, Future)：本请求负责合成，结束后（无论成败）必须调用 release(key, future, ...)
+        """
+        while True:
+            path = self.lookup(key)
+            if path is not None:
+                return path, None
+            with self._lock:
+                if not current_config().voices.cache:
+                    # 临时文件播放后即删除，不能与其他请求共用：各自合成
+                    return None, Future()
+                future = self._inflight.get(key)
+                owner = future is None
+                if owner:
+                    future = self._inflight[key] = Future()
+                else:
+                    self._stats["joined"] += 1
+            if owner:
+                return None, future
+            try:
+                return self._join(future), None
+            except calls.Cancelled:
+                # 被打断的是负责合成的那个请求，本请求仍然有效：重新查找或自己合成
+                calls.check_cancelled()
+
+    def release(self, key: str, future: Future, path: str = None, error: BaseException = None):
+        """
+        负责合成的一方结束：唤醒等待同一键的请求；error 为 Cancelled 时它们会重新查找或自己合成
+        """
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(path)
+
+    def lookup(self, key: str):
+        """
+        命中返回文件路径并更新播放时间；未命中、已关闭复用或文件已被删除时返回 None
+        """
+        if not current_config().voices.cache:
+            return None
+        with self._lock:
+            row = self._connect().execute("SELECT key FROM voices WHERE key = ?", (key,)).fetchone()
+            if row is not None and not os.path.exists(self.path(key)):
+                self._conn.execute("DELETE FROM voices WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+            self._conn.execute("UPDATE voices SET played = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self._stats["hits"] += 1
+            return self.path(key)
+
+    def store(self, key: str, sentence: str, emotion: str, reference: str, data: bytes) -> str:
+        """
+        写入文件（先写临时文件再改名，播放方不会读到一半）并登记索引，超出容量时淘汰
+        已关闭复用时只写入临时文件，不登记也不淘汰
+        """
+        if not current_config().voices.cache:
+            return self._store_transient(data)
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(key)
+        temp = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp, "wb") as f:
+            f.write(data)
+        os.replace(temp, path)
+        now = time.time()
+        sentence_hash = hashlib.sha256(sentence.encode("utf-8")).hexdigest()
+        with self._lock:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO voices (key, sentence, emotion, reference, bytes, created, played) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", (key, sentence_hash, emotion, reference, len(data), now, now))
+            self._evict(current_config().voices.max_mb * 1024 ** 2, keep=key)
+            self._conn.commit()
+        return path
+
+    def discard(self, path: str):
+        """
+        播放结束后调用：删除关闭复用时写入的临时文件；缓存中的文件保留
+        """
+        if os.path.dirname(os.path.abspath(path)) != os.path.abspath(self.transient_dir):
+            return
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            log(f"删除临时语音 {path} 失败：{e}", "warning")
+
+    def stats(self) -> dict:
+        with self._lock:
+            result = dict(self._stats)
+            result["hit_rate"] = result["hits"] / max(1, result["hits"] + result["misses"])
+            if self._conn is not None:
+                entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM voices").fetchone()
+                result.update(entries=entries, mb=size / 1024 ** 2)
+            return result
+
+    def clear(self):
+        with self._lock:
+            for (key,) in self._connect().execute("SELECT key FROM voices").fetchall():
+                self._remove(key)
+            self._conn.execute("DELETE FROM voices")
+            self._conn.commit()
+
+    # -------------- 内部 ------------------
+    def _synthesize(self, key, sentence, emotion, reference, synthesize, future: Future) -> str:
+        try:
+            path = self.store(key, sentence, emotion, reference, synthesize())
+        except BaseException as e:
+            self.release(key, future, error=e)
+            raise
+        self.release(key, future, path=path)
+        return path
+
+    def _store_transient(self, data: bytes) -> str:
+        with self._lock:
+            if not self._swept:
+                # 上次运行中未播放（被打断）的临时文件
+                shutil.rmtree(self.transient_dir, ignore_errors=True)
+                self._swept = True
+        os.makedirs(self.transient_dir, exist_ok=True)
+        fd, path = tempfile.mkstemp(suffix=".wav", dir=self.transient_dir)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        return path
+
+    def _join(self, future: Future) -> str:
+        # 等待期间仍响应本线程的中断
+        while not wait([future], timeout=calls.POLL_INTERVAL).done:
+            calls.check_cancelled()
+        return future.result()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            # 多个合成线程共用一个连接，由 self._lock 串行化
+            self._conn = sqlite3.connect(self.index_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS voices (
+                key TEXT PRIMARY KEY, sentence TEXT NOT NULL, emotion TEXT NOT NULL, reference TEXT NOT NULL,
+                bytes INTEGER NOT NULL, created REAL NOT NULL, played REAL NOT NULL)""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS voices_played ON voices (played)")
+            self._evict(current_config().voices.max_mb * 1024 ** 2)
+            self._conn.commit()
+        return self._conn
+
+    def _evict(self, budget: int, keep: str = None):
+        """
+        从最久未播放的开始删除，直到总大小不超过 budget；keep 为刚写入的文件，不删除
+        """
+        total = self._conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM voices").fetchone()[0]
+        if total <= budget:
+            return
+        evicted = 0
+        for key, size in self._conn.execute("SELECT key, bytes FROM voices ORDER BY played").fetchall():
+            if total <= budget:
+                break
+            if key == keep or not self._remove(key):
+                continue
+            self._conn.execute("DELETE FROM voices WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        self._stats["evicted"] += evicted
+        log(f"语音缓存清理：淘汰 {evicted} 条，剩余 {total / 1024 ** 2:.1f} MB", "info")
+
+    def _remove(self, key: str) -> bool:
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            # Windows 上正在播放的文件无法删除，保留索引，留待下次清理
+            log(f"删除语音缓存 {key} 失败：{e}", "warning")
+            return False
+        return True
+
+voice_cache = VoiceCache()
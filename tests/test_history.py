@@ -0,0 +1,45 @@
+import pytest
+from src import history as histories
+from src import router as router_module
+from src.config import parse_config
+
+ENDPOINTS = {
+    "base_url": "http://cloud", "api_key": "x", "model_id": "cloud-model",
+    "local_base_url": "http://local", "local_api_key": "x", "local_model_id": "local-model",
+    "sovits_base_url": "http://sovits",
+}
+
+@pytest.fixture
+def use_config(monkeypatch):
+    def apply(**sections):
+        snapshot = parse_config({"endpoints": ENDPOINTS, **sections})
+        monkeypatch.setattr(histories, "current_config", lambda: snapshot)
+        monkeypatch.setattr(router_module, "current_config", lambda: snapshot)
+        return snapshot
+    return apply
+
+def conversation(turns: int) -> list:
+    history = [{"role": "system", "content": "人设"}]
+    for i in range(turns):
+        history.append({"role": "user", "content": f"第{i}轮的问题" * 5})
+        history.append({"role": "assistant", "content": f"第{i}轮的回答" * 5})
+    return history
+
+def test_model_budget_changes_what_is_trimmed(use_config):
+    use_config(history={"max_tokens": 100000, "model_budgets": {"local-model": 200}})
+    manager = histories.HistoryManager("测试", summarize=False)
+
+    cloud = manager.prepare(conversation(20), "cloud-model")
+    local = manager.prepare(conversation(20), "local-model")
+
+    assert cloud == conversation(20)
+    assert histories.estimate_tokens(local) <= 200
+    assert local[0] == {"role": "system", "content": "人设"}
+    assert local[-2:] == conversation(20)[-2:]
+
+def test_primary_model_follows_routing_policy(use_config):
+    use_config(routing={"policy": {"layers": "local"}})
+    router = router_module.Router()
+
+    assert router.primary_model("layers") == "local-model"
+    assert router.primary_model("reply") == "cloud-model"
@@ -0,0 +1,43 @@
+import os
+import numpy as np
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from src import sprite
+from src.atlas import AtlasWriter, atlas_key
+from src.bake import _render
+from src.generate import generate_fgimage
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TARGET, COMBO, SCALE = "ムラサメb", (1717, 1475, 1261), 0.5
+
+@pytest.fixture(autouse=True)
+def in_src(monkeypatch):
+    monkeypatch.chdir(os.path.join(ROOT, "src"))      # 资源路径均相对 src/
+
+def qimage_pixels(qimg) -> np.ndarray:
+    """
+    DISPLAY_FORMAT（小端下按 B, G, R, A 存放）的像素 → 与合成画布相同排列的数组
+    """
+    bits = qimg.constBits()
+    bits.setsize(qimg.sizeInBytes())
+    rows = np.frombuffer(bits, dtype=np.uint8).reshape(qimg.height(), qimg.bytesPerLine())
+    return rows[:, :qimg.width() * 4].reshape(qimg.height(), qimg.width(), 4)
+
+def test_atlas_sprite_keeps_composite_edge_pixels(tmp_path, monkeypatch):
+    canvas = generate_fgimage(TARGET, COMBO, scale=SCALE)
+
+    _, width, height, stride, data = _render(TARGET, SCALE, COMBO)
+    path = str(tmp_path / "sprite.atlas")
+    writer = AtlasWriter(path, sprite.atlas_meta(TARGET, SCALE))
+    writer.add(atlas_key(COMBO), width, height, stride, data)
+    writer.close()
+    monkeypatch.setattr(sprite, "atlas_path", lambda target, scale: path)
+    cache = sprite.SpriteCache(max_entries=1, disk=False)
+    pixels = qimage_pixels(cache._from_atlas(TARGET, COMBO, SCALE))
+
+    # 半透明边缘：预乘颜色只能经过一次 alpha
+    edge = (canvas[..., 3] > 0) & (canvas[..., 3] < 255)
+    assert edge.sum() > 100
+    assert np.abs(pixels[edge].astype(np.int16) - canvas[edge].astype(np.int16)).max() <= 1